@@ -0,0 +1,155 @@
+import atexit
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+import diskcache
+import numpy as np
+import orjson
+
+
+class DiskCache:
+    """Exact-match response cache persisted with diskcache"""
+
+    def __init__(self, directory: Path):
+        self.cache = diskcache.Cache(str(directory))
+
+    @staticmethod
+    def make_key(provider: str, model: str, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        """Hash everything that determines the model's response"""
+        payload = orjson.dumps({
+            "p": provider,
+            "m": model,
+            "msgs": messages,
+            "t": temperature,
+            "mx": max_tokens
+        }, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(payload).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(key)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self.cache.set(key, value)
+
+    def close(self):
+        self.cache.close()
+
+
+class SemanticCache:
+    """Near-duplicate prompt cache: FAISS HNSW index over embeddings, responses in SQLite"""
+
+    def __init__(self, directory: Path, threshold: float = 0.92, model_name: str = "all-MiniLM-L6-v2",
+                 dim: int = 384, save_every: int = 100, candidates: int = 8):
+        import faiss
+
+        self.faiss = faiss
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.candidates = candidates
+        self.model_name = model_name
+        self._model = None
+
+        # Methods run in worker threads; one lock covers the model, index and connection
+        self._lock = threading.Lock()
+
+        self.index_file = self.directory / "embeddings.faiss"
+        if self.index_file.exists():
+            self.index = faiss.read_index(str(self.index_file))
+        else:
+            # Inner product on normalized vectors is cosine similarity
+            self.index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+
+        # Row ids match FAISS vector ids; each row keeps its vector so the index
+        # file only needs writing now and then, not on every insert. The scope
+        # must match exactly for a hit, so similar issues never cross repos or providers
+        self.db = sqlite3.connect(str(self.directory / "responses.db"), check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (id INTEGER PRIMARY KEY, response BLOB NOT NULL, embedding BLOB, scope TEXT)")
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(responses)")]
+        if "embedding" not in columns:
+            self.db.execute("ALTER TABLE responses ADD COLUMN embedding BLOB")
+        if "scope" not in columns:
+            self.db.execute("ALTER TABLE responses ADD COLUMN scope TEXT")
+        self.db.commit()
+
+        self.save_every = save_every
+        self._unsaved = self._restore_unsaved()
+        atexit.register(self.close)
+
+    def _restore_unsaved(self) -> int:
+        """Re-add vectors stored after the index file was last written"""
+        rows = self.db.execute("SELECT id, embedding FROM responses WHERE id >= ? ORDER BY id",
+                               (self.index.ntotal,)).fetchall()
+        restored = 0
+        for row_id, embedding in rows:
+            if row_id != self.index.ntotal or embedding is None:
+                # Ids must stay in step with the index; rows past a gap can't be placed
+                self.db.execute("DELETE FROM responses WHERE id >= ?", (row_id,))
+                self.db.commit()
+                break
+            self.index.add(np.frombuffer(embedding, dtype=np.float32).reshape(1, -1))
+            restored += 1
+        return restored
+
+    def embed(self, text: str) -> np.ndarray:
+        """Return the L2-normalized embedding of text"""
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            model = self._model
+        return model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def lookup(self, query: np.ndarray, scope: str) -> Optional[Dict[str, Any]]:
+        """Return the closest stored response in scope if it clears the threshold"""
+        with self._lock:
+            if self.index.ntotal == 0:
+                return None
+
+            sims, ids = self.index.search(query.reshape(1, -1), min(self.candidates, self.index.ntotal))
+            close = [int(i) for sim, i in zip(sims[0], ids[0]) if i >= 0 and sim > self.threshold]
+            if not close:
+                return None
+
+            placeholders = ",".join("?" * len(close))
+            rows = dict(self.db.execute(
+                f"SELECT id, response FROM responses WHERE scope = ? AND id IN ({placeholders})",
+                (scope, *close)
+            ).fetchall())
+        # Candidates come back most similar first
+        best = next((rows[i] for i in close if i in rows), None)
+        return orjson.loads(best) if best is not None else None
+
+    def add(self, query: np.ndarray, scope: str, response: Dict[str, Any]):
+        """Store a response under its query embedding and scope"""
+        with self._lock:
+            vector_id = self.index.ntotal
+            self.index.add(query.reshape(1, -1))
+
+            self.db.execute("INSERT OR REPLACE INTO responses (id, response, embedding, scope) VALUES (?, ?, ?, ?)",
+                            (vector_id, orjson.dumps(response), query.astype(np.float32).tobytes(), scope))
+            self.db.commit()
+
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self._save()
+
+    def _save(self):
+        """Write beside the live index and swap it in atomically"""
+        tmp_file = self.index_file.with_suffix(".tmp")
+        self.faiss.write_index(self.index, str(tmp_file))
+        tmp_file.replace(self.index_file)
+        self._unsaved = 0
+
+    def close(self):
+        """Persist unsaved vectors and close the database"""
+        with self._lock:
+            if self.db is None:
+                return
+            if self._unsaved:
+                self._save()
+            self.db.close()
+            self.db = None
@@ -1,11 +1,61 @@
 import os
+import sys
+import mmap
 import json
 import time
-from typing import Dict, List, Optional, Any
+import asyncio
+from typing import Callable, Dict, List, Optional, Any
 from dataclasses import dataclass
-from openai import OpenAI
-import requests
 from enum import Enum
+from types import MappingProxyType
+from config.settings import Settings
+from agent.cache import DiskCache, SemanticCache
+from agent.rate_limiter import TokenBucket
+
+# Static prompts are module constants so every request sends a byte-identical
+# prefix that provider-side prompt caches can reuse; only the user turn varies.
+SYSTEM_PROMPT_SOLVE = sys.intern("""You are a coding agent that MUST take concrete actions to solve problems.
+
+CRITICAL RULES:
+1. You MUST use tools to make actual file changes - never just describe solutions
+2. For every problem, follow this sequence:
+   - Use str_replace_editor to VIEW the relevant files first
+   - Use str_replace_editor to EDIT files with specific changes  
+   - Use bash to run tests and verify changes
+   - Always end with actual file modifications
+
+3. Your response must include actual tool calls, not just explanations
+4. Think step by step, but ALWAYS execute the steps with tools
+
+Available tools: bash, str_replace_editor, web_search
+
+Format your tool calls as:
+
+{"tool": "tool_name", "parameters": {...}}
+""")
+
+SYSTEM_PROMPT_MODIFY = sys.intern("You are improving an AI agent's code. Suggest ONE specific code change that would improve performance based on the failure log.")
+
+SOLVE_USER_TEMPLATE = """
+Fix this GitHub issue in the repository at {repo_path}:
+
+{issue_text}
+
+You MUST:
+1. First examine the relevant files using str_replace_editor
+2. Make the necessary code changes using str_replace_editor  
+3. Test your changes using bash
+4. Provide a summary of what you changed
+
+START WORKING NOW - use the tools immediately, don't just plan.
+"""
+
+MODIFY_USER_TEMPLATE = """
+Performance log:
+{performance_log}
+
+Suggest ONE concrete improvement to the agent code. Be specific about what file to change and what code to modify.
+"""
 
 class ModelProvider(Enum):
     LM_STUDIO = "lm_studio"
@@ -21,9 +71,12 @@ class ModelConfig:
     max_tokens: int = 4000
     temperature: float = 0.6
     requests_per_minute: int = 30
+    supports_cache_control: bool = False
 
 class MultiModelAgent:
-    def __init__(self):
+    def __init__(self, settings: Optional[Settings] = None, use_cache: bool = False):
+        self.settings = settings or Settings()
+        self.use_cache = use_cache
         self.models = {
             ModelProvider.LM_STUDIO: ModelConfig(
                 provider=ModelProvider.LM_STUDIO,
@@ -36,7 +89,7 @@ class MultiModelAgent:
             ModelProvider.GROQ: ModelConfig(
                 provider=ModelProvider.GROQ,
                 model_name="qwen-qwq-32b",
-                api_key=os.getenv("GROQ_API_KEY"),
+                api_key=self.settings.groq_api_key,
                 base_url="https://api.groq.com/openai/v1",
                 max_tokens=4000,
                 temperature=0.6,
@@ -45,27 +98,60 @@ class MultiModelAgent:
             ModelProvider.OPENROUTER: ModelConfig(
                 provider=ModelProvider.OPENROUTER,
                 model_name="deepseek/deepseek-r1-0528:free",
-                api_key=os.getenv("OPENROUTER_API_KEY"),
+                api_key=self.settings.openrouter_api_key,
                 base_url="https://openrouter.ai/api/v1",
                 max_tokens=6000,
                 temperature=0.3,
-                requests_per_minute=20
+                requests_per_minute=20,
+                supports_cache_control=True
             )
         }
 
+        # Only memoize deterministic calls unless caching is explicitly requested;
+        # the on-disk cache is opened only when some call can use it
+        self.cache = None
+        if use_cache or any(config.temperature == 0 for config in self.models.values()):
+            self.settings.ARCHIVE_DIR.mkdir(exist_ok=True)
+            self.cache = DiskCache(self.settings.ARCHIVE_DIR / "llm_cache")
+
+        # Pace each provider at its configured requests_per_minute
+        self.buckets = {
+            provider: TokenBucket(rate=config.requests_per_minute / 60.0, capacity=config.requests_per_minute)
+            for provider, config in self.models.items()
+        }
+
         self.clients = {}
+        self._base_kwargs = {}
+        self._inflight: Dict[Any, asyncio.Future] = {}
         self._initialize_clients()
         self.current_provider = ModelProvider.GROQ  # Default provider
 
+        # Providers tried in order when the current one fails
+        self.failover_order: List[ModelProvider] = [
+            ModelProvider.GROQ,
+            ModelProvider.OPENROUTER,
+            ModelProvider.LM_STUDIO
+        ]
+        self.breaker_threshold = 3
+        self.breaker = {p: {"fails": 0, "open_until": 0} for p in self.models}
+
     def _initialize_clients(self):
-        """Initialize OpenAI clients for each provider"""
+        """Initialize async OpenAI clients for each provider"""
+        from openai import AsyncOpenAI
+
         for provider, config in self.models.items():
             try:
                 if config.api_key or provider == ModelProvider.LM_STUDIO:
-                    self.clients[provider] = OpenAI(
+                    self.clients[provider] = AsyncOpenAI(
                         api_key=config.api_key or "not-needed",
                         base_url=config.base_url
                     )
+                    self._base_kwargs[provider] = MappingProxyType({
+                        "model": config.model_name,
+                        "max_tokens": config.max_tokens,
+                        "temperature": config.temperature,
+                        **({"top_p": 0.95, "stop": [""]} if provider == ModelProvider.GROQ else {})
+                    })
                     print(f"✅ {provider.value} client initialized")
                 else:
                     print(f"⚠️ {provider.value} API key not found, skipping")
@@ -84,114 +170,234 @@ class MultiModelAgent:
         else:
             raise ValueError(f"Provider {provider.value} not available")
 
-    def call_model(self, messages: List[Dict], provider: Optional[ModelProvider] = None) -> Dict:
-        """Call model with specified provider (no fallback)"""
-        if provider is None:
-            provider = self.current_provider
+    async def call_model(self, messages: List[Dict], provider: Optional[ModelProvider] = None,
+                         on_delta: Optional[Callable[[str], bool]] = None) -> Dict:
+        """Call model, failing over to the next provider whose circuit is closed"""
+        from openai import APIError
+
+        preferred = provider or self.current_provider
+        chain = [preferred] + [p for p in self.failover_order if p != preferred]
+
+        errors = []
+        for candidate in chain:
+            if candidate not in self.clients:
+                continue
+
+            if self.breaker[candidate]["open_until"] > time.monotonic():
+                continue
+
+            # The breaker is updated in _make_request, once per API call
+            try:
+                return await self._make_request(candidate, messages, on_delta)
+            except APIError as e:
+                print(f"⚠️ {candidate.value} failed: {e}")
+                errors.append(f"{candidate.value}: {e}")
+
+        if not errors:
+            raise Exception(f"Provider {preferred.value} not available")
+        raise Exception(f"All providers failed: {'; '.join(errors)}")
+
+    def _record_failure(self, provider: ModelProvider):
+        """Count a failed API call and open the circuit past the threshold"""
+        state = self.breaker[provider]
+        state["fails"] += 1
+        if state["fails"] >= self.breaker_threshold:
+            # Back off exponentially while the provider keeps failing
+            cooldown = 30 * 2 ** (state["fails"] - self.breaker_threshold)
+            state["open_until"] = time.monotonic() + cooldown
+            print(f"🔌 {provider.value} circuit open for {cooldown}s")
+
+    def _record_success(self, provider: ModelProvider):
+        state = self.breaker[provider]
+        state["fails"] = 0
+        state["open_until"] = 0
+
+    async def _make_request(self, provider: ModelProvider, messages: List[Dict],
+                            on_delta: Optional[Callable[[str], bool]] = None) -> Dict:
+        """Make request to specific provider, streaming when on_delta is given"""
+        from openai import APIError
+
+        config = self.models[provider]
+        key = DiskCache.make_key(provider.value, config.model_name, messages,
+                                 config.temperature, config.max_tokens)
+
+        cacheable = self.cache is not None and (self.use_cache or config.temperature == 0)
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        # Identical concurrent requests share a single API call; only the
+        # caller that made it counts its outcome against the breaker
+        flight_key = (key, on_delta is not None)
+        pending = self._inflight.get(flight_key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight_key] = future
+        try:
+            result = await self._send_request(provider, messages, on_delta)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if isinstance(e, APIError):
+                self._record_failure(provider)
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        else:
+            self._record_success(provider)
+            future.set_result(result)
+        finally:
+            del self._inflight[flight_key]
 
-        if provider not in self.clients:
-            raise Exception(f"Provider {provider.value} not available")
+        # A stream cut short is partial output and must not be served later
+        if cacheable and result["finish_reason"] != "stopped_early":
+            self.cache.set(key, result)
 
-        return self._make_request(provider, messages)
+        return result
 
-    def _make_request(self, provider: ModelProvider, messages: List[Dict]) -> Dict:
-        """Make request to specific provider"""
+    async def _send_request(self, provider: ModelProvider, messages: List[Dict],
+                            on_delta: Optional[Callable[[str], bool]]) -> Dict:
+        """Send one rate-limited request to the provider"""
         client = self.clients[provider]
         config = self.models[provider]
 
-        kwargs = {
-            "model": config.model_name,
-            "messages": messages,
-            "max_tokens": config.max_tokens,
-            "temperature": config.temperature
-        }
+        await self.buckets[provider].acquire()
+
+        if config.supports_cache_control:
+            messages = self._mark_system_cacheable(messages)
+
+        kwargs = {**self._base_kwargs[provider], "messages": messages}
 
-        if provider == ModelProvider.GROQ:
-            kwargs.update({
-                "top_p": 0.95,
-                "stop": [""]
-            })
+        if on_delta is not None:
+            result = await self._stream_request(client, kwargs, on_delta)
+            result.update({"provider": provider.value, "model": config.model_name})
+            return result
 
-        response = client.chat.completions.create(**kwargs)
+        response = await client.chat.completions.create(**kwargs)
 
         return {
             "content": response.choices[0].message.content,
             "provider": provider.value,
             "model": config.model_name,
             "finish_reason": response.choices[0].finish_reason,
-            "usage": response.usage.dict() if response.usage else None
+            "usage": response.usage.dict() if response.usage else None,
+            "cached_tokens": self._cached_tokens(response.usage)
         }
 
+    @staticmethod
+    async def _stream_request(client: Any, kwargs: Dict, on_delta: Callable[[str], bool]) -> Dict:
+        """Accumulate a streamed completion, closing the stream once on_delta returns True"""
+        stream = await client.chat.completions.create(stream=True, **kwargs)
+
+        parts = []
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta.content
+                if delta:
+                    parts.append(delta)
+                    if on_delta(delta):
+                        finish_reason = "stopped_early"
+                        break
+                finish_reason = choice.finish_reason or finish_reason
+        finally:
+            await stream.close()
+
+        # Each content chunk is roughly one token, so the unused budget is an upper bound
+        tokens_saved = kwargs["max_tokens"] - len(parts) if finish_reason == "stopped_early" else 0
+
+        return {
+            "content": "".join(parts),
+            "finish_reason": finish_reason,
+            "usage": None,
+            "cached_tokens": 0,
+            "tokens_saved": max(tokens_saved, 0)
+        }
+
+    @staticmethod
+    def _mark_system_cacheable(messages: List[Dict]) -> List[Dict]:
+        """Attach an ephemeral cache_control breakpoint to the system prompt"""
+        marked = []
+        for message in messages:
+            if message["role"] == "system" and isinstance(message["content"], str):
+                message = {
+                    "role": "system",
+                    "content": [{
+                        "type": "text",
+                        "text": message["content"],
+                        "cache_control": {"type": "ephemeral"}
+                    }]
+                }
+            marked.append(message)
+        return marked
+
+    @staticmethod
+    def _cached_tokens(usage: Any) -> int:
+        """Number of prompt tokens the provider served from its prefix cache"""
+        details = getattr(usage, "prompt_tokens_details", None)
+        return getattr(details, "cached_tokens", None) or 0
+
 class ActionForcingAgent(MultiModelAgent):
     """Agent that forces models to take actual actions"""
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, settings: Optional[Settings] = None, use_cache: bool = False,
+                 use_semantic_cache: bool = False):
+        super().__init__(settings=settings, use_cache=use_cache)
+        self.semantic_cache = SemanticCache(self.settings.ARCHIVE_DIR / "semantic_cache") if use_semantic_cache else None
         self.tools = {
             "bash": self._bash_tool,
             "str_replace_editor": self._editor_tool,
             "web_search": self._web_search_tool
         }
 
-    def solve_task(self, issue_text: str, repo_path: str, provider: Optional[ModelProvider] = None) -> Dict:
+    async def solve_task(self, issue_text: str, repo_path: str, provider: Optional[ModelProvider] = None,
+                         on_delta: Optional[Callable[[str], bool]] = None) -> Dict:
         """Solve coding task with action-forcing prompts"""
-
-        system_prompt = """You are a coding agent that MUST take concrete actions to solve problems.
-
-CRITICAL RULES:
-1. You MUST use tools to make actual file changes - never just describe solutions
-2. For every problem, follow this sequence:
-   - Use str_replace_editor to VIEW the relevant files first
-   - Use str_replace_editor to EDIT files with specific changes  
-   - Use bash to run tests and verify changes
-   - Always end with actual file modifications
-
-3. Your response must include actual tool calls, not just explanations
-4. Think step by step, but ALWAYS execute the steps with tools
-
-Available tools: bash, str_replace_editor, web_search
-
-Format your tool calls as:
-
-{"tool": "tool_name", "parameters": {...}}
-"""
+        user_prompt = SOLVE_USER_TEMPLATE.format(repo_path=repo_path, issue_text=issue_text)
 
         messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"""
-Fix this GitHub issue in the repository at {repo_path}:
-
-{issue_text}
-
-You MUST:
-1. First examine the relevant files using str_replace_editor
-2. Make the necessary code changes using str_replace_editor  
-3. Test your changes using bash
-4. Provide a summary of what you changed
-
-START WORKING NOW - use the tools immediately, don't just plan.
-"""}
+            {"role": "system", "content": SYSTEM_PROMPT_SOLVE},
+            {"role": "user", "content": user_prompt}
         ]
 
+        # Paraphrased issues can reuse an earlier response for the same repo and
+        # provider. Only the issue is embedded; the shared template would pull
+        # every prompt together. Embedding and index work run in threads so
+        # other coroutines keep going
+        query = None
+        if self.semantic_cache is not None:
+            scope = f"{(provider or self.current_provider).value}\0{repo_path}"
+            query = await asyncio.to_thread(self.semantic_cache.embed, issue_text)
+            cached = await asyncio.to_thread(self.semantic_cache.lookup, query, scope)
+            if cached is not None:
+                return cached
+
         try:
-            return self.call_model(messages, provider)
+            result = await self.call_model(messages, provider, on_delta)
         except Exception as e:
             raise Exception(f"Task failed with {self.current_provider.value}: {e}")
 
-    def self_modify(self, performance_log: str, provider: Optional[ModelProvider] = None) -> Dict:
+        if query is not None and result["finish_reason"] != "stopped_early":
+            await asyncio.to_thread(self.semantic_cache.add, query, scope, result)
+
+        return result
+
+    async def self_modify(self, performance_log: str, provider: Optional[ModelProvider] = None) -> Dict:
         """Generate self-improvement suggestions"""
         messages = [
-            {"role": "system", "content": "You are improving an AI agent's code. Suggest ONE specific code change that would improve performance based on the failure log."},
-            {"role": "user", "content": f"""
-Performance log:
-{performance_log}
-
-Suggest ONE concrete improvement to the agent code. Be specific about what file to change and what code to modify.
-"""}
+            {"role": "system", "content": SYSTEM_PROMPT_MODIFY},
+            {"role": "user", "content": MODIFY_USER_TEMPLATE.format(performance_log=performance_log)}
         ]
 
         try:
-            return self.call_model(messages, provider)
+            return await self.call_model(messages, provider)
         except Exception as e:
             raise Exception(f"Self-modification failed with {self.current_provider.value}: {e}")
 
@@ -216,13 +422,39 @@ Suggest ONE concrete improvement to the agent code. Be specific about what file
 
         elif action == "str_replace":
             try:
-                with open(kwargs["path"], "r") as f:
-                    content = f.read()
-
-                new_content = content.replace(kwargs["old_str"], kwargs["new_str"])
-
-                with open(kwargs["path"], "w") as f:
-                    f.write(new_content)
+                old = kwargs["old_str"].encode()
+                new = kwargs["new_str"].encode()
+
+                if not old or os.path.getsize(kwargs["path"]) == 0:
+                    # mmap can't map an empty file; keep str semantics for an empty old_str
+                    with open(kwargs["path"], "r") as f:
+                        content = f.read()
+
+                    new_content = content.replace(kwargs["old_str"], kwargs["new_str"])
+
+                    with open(kwargs["path"], "w") as f:
+                        f.write(new_content)
+
+                    return f"File {kwargs['path']} updated successfully"
+
+                with open(kwargs["path"], "r+b") as f:
+                    tail = None
+                    with mmap.mmap(f.fileno(), 0) as mm:
+                        first = mm.find(old)
+                        if first != -1 and len(old) == len(new):
+                            # Same length: patch each occurrence in place
+                            idx = first
+                            while idx != -1:
+                                mm[idx:idx + len(old)] = new
+                                idx = mm.find(old, idx + len(old))
+                        elif first != -1:
+                            tail = mm[first:].replace(old, new)
+
+                    # Length changed: only rewrite from the first match onwards
+                    if tail is not None:
+                        f.seek(first)
+                        f.write(tail)
+                        f.truncate()
 
                 return f"File {kwargs['path']} updated successfully"
             except Exception as e:
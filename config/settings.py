@@ -1,7 +1,11 @@
+import os
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
-@dataclass
+@dataclass(frozen=True)
 class Settings:
     ARCHIVE_DIR: Path = Path("archive")
     EVAL_DIR: Path = Path("eval")
+    groq_api_key: Optional[str] = field(default_factory=lambda: os.getenv("GROQ_API_KEY"))
+    openrouter_api_key: Optional[str] = field(default_factory=lambda: os.getenv("OPENROUTER_API_KEY"))
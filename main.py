@@ -1,14 +1,43 @@
 import os
-import json
+import re
 import time
+import asyncio
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+import orjson
 from agent.multi_model_agent import ActionForcingAgent, ModelProvider
 from config.settings import Settings
 
+# Evaluation tasks, each paired with a keyword an on-task answer must mention
+EVAL_PROMPTS = [
+    ("factorial", """
+        Create a Python function that calculates the factorial of a number.
+        The function should handle edge cases like 0 and negative numbers.
+        """),
+    ("fibonacci", """
+        Create a Python function that returns the n-th Fibonacci number.
+        The function should handle n = 0 and reject negative input.
+        """),
+    ("palindrome", """
+        Create a Python function that checks whether a string is a palindrome.
+        The function should ignore case, spaces and punctuation.
+        """),
+    ("gcd", """
+        Create a Python function that computes the greatest common divisor (gcd) of two integers.
+        The function should handle zero and negative numbers.
+        """),
+    ("prime", """
+        Create a Python function that checks whether a number is prime.
+        The function should handle 0, 1 and negative numbers.
+        """),
+]
+
 class SelfImprovingFramework:
     def __init__(self):
-        self.agent = ActionForcingAgent()
         self.settings = Settings()
+        self.agent = ActionForcingAgent(settings=self.settings)
         self.iteration_count = 0
         self.best_score = 0.0
 
@@ -16,36 +45,53 @@ class SelfImprovingFramework:
         self.settings.ARCHIVE_DIR.mkdir(exist_ok=True)
         self.settings.EVAL_DIR.mkdir(exist_ok=True)
 
-    def run_evolution_loop(self):
+        # Archive writes run off the loop; pending ones are flushed at exit
+        self._io_pool = ThreadPoolExecutor(max_workers=1)
+        atexit.register(self._io_pool.shutdown, wait=True)
+
+    def run_evolution_loop(self, max_iterations: int = 10, max_workers: int = 3):
         """Main self-improvement loop"""
         print("🧬 Starting Self-Improvement Evolution Loop")
         print(f"📊 Available models: {[p.value for p in self.agent.get_available_providers()]}")
         print(f"🎯 Current provider: {self.agent.current_provider.value}")
 
-        while self.iteration_count < 10:
-            try:
-                print(f"\n🔁 Iteration {self.iteration_count}")
-                score = self.evaluate_agent()
-                print(f"🏅 Score: {score:.2%}")
+        asyncio.run(self._loop(max_iterations, max_workers))
 
-                if score > self.best_score:
-                    self.best_score = score
-                    self.archive_agent(score)
-                    print(f"🎉 New best score: {score:.2%}")
+        print(f"🏁 Evolution complete! Best score: {self.best_score:.2%}")
 
-                improvement = self.generate_improvement()
-                print(f"🔧 Generated improvement: {improvement['content'][:200]}...")
+    async def _loop(self, max_iterations: int, max_workers: int):
+        """Run iterations concurrently, at most max_workers in flight"""
+        semaphore = asyncio.Semaphore(max_workers)
 
-                self.iteration_count += 1
+        async def bounded(iteration: int):
+            async with semaphore:
+                await self._run_iteration(iteration)
 
-                time.sleep(2)
+        await asyncio.gather(*(bounded(i) for i in range(max_iterations)))
 
-            except Exception as e:
-                print(f"❌ Error in iteration {self.iteration_count}: {e}")
-                print(f"💡 Consider switching providers manually or check {self.agent.current_provider.value} connection")
-                self.iteration_count += 1
+    async def _run_iteration(self, iteration: int):
+        """Evaluate and generate an improvement concurrently for one iteration"""
+        try:
+            print(f"\n🔁 Iteration {iteration}")
+            score, improvement = await asyncio.gather(
+                self.evaluate_agent(),
+                self.generate_improvement(iteration)
+            )
+            print(f"🏅 Score: {score:.2%}")
 
-        print(f"🏁 Evolution complete! Best score: {self.best_score:.2%}")
+            if score > self.best_score:
+                self.best_score = score
+                self.archive_agent(score, iteration)
+                print(f"🎉 New best score: {score:.2%}")
+
+            print(f"🔧 Generated improvement: {improvement['content'][:200]}...")
+
+        except Exception as e:
+            print(f"❌ Error in iteration {iteration}: {e}")
+            print(f"💡 Consider switching providers manually or check {self.agent.current_provider.value} connection")
+
+        finally:
+            self.iteration_count += 1
 
     def switch_provider(self, provider: ModelProvider):
         """Manually switch to different provider"""
@@ -55,36 +101,70 @@ class SelfImprovingFramework:
         except Exception as e:
             print(f"❌ Failed to switch to {provider.value}: {e}")
 
-    def evaluate_agent(self) -> float:
-        """Evaluate agent performance with current provider"""
-        test_issue = """
-        Create a Python function that calculates the factorial of a number.
-        The function should handle edge cases like 0 and negative numbers.
-        """
-
-        try:
-            result = self.agent.solve_task(test_issue, "/tmp/test_repo")
-
-            content = result.get("content", "")
-
-            score = 0.0
-            if "def " in content:
-                score += 0.3
-            if "tool_call" in content:
-                score += 0.4
-            if "factorial" in content.lower():
-                score += 0.3
-
-            return min(score, 1.0)
-
-        except Exception as e:
-            print(f"❌ Evaluation failed: {e}")
-            return 0.0
-
-    def generate_improvement(self) -> dict:
+    async def evaluate_agent(self) -> float:
+        """Evaluate agent on a batch of tasks concurrently and average the scores"""
+        semaphore = asyncio.Semaphore(8)
+
+        async def run(keyword: str, issue: str) -> float:
+            async with semaphore:
+                try:
+                    result = await self.agent.solve_task(issue, "/tmp/test_repo",
+                                                         on_delta=self._saturation_check(keyword))
+                except Exception as e:
+                    print(f"❌ Evaluation failed: {e}")
+                    return 0.0
+                return self.score_response(result.get("content") or "", keyword)
+
+        scores = await asyncio.gather(*(run(keyword, issue) for keyword, issue in EVAL_PROMPTS))
+        return sum(scores) / len(scores)
+
+    @staticmethod
+    def find_markers(content: str, keyword: str) -> set:
+        """Return the scoring markers present in content"""
+        found = set()
+        for match in _marker_pattern(keyword).finditer(content):
+            marker = match.group(0)
+            found.add(marker if marker in ("def ", "tool_call") else keyword)
+            if len(found) == 3:
+                break
+        return found
+
+    @classmethod
+    def score_response(cls, content: str, keyword: str) -> float:
+        """Score a response by whether it writes code, calls tools and stays on task"""
+        found = cls.find_markers(content, keyword)
+
+        score = 0.0
+        if "def " in found:
+            score += 0.3
+        if "tool_call" in found:
+            score += 0.4
+        if keyword in found:
+            score += 0.3
+
+        return min(score, 1.0)
+
+    @classmethod
+    def _saturation_check(cls, keyword: str):
+        """Build an on_delta callback that stops the stream once the score can't rise"""
+        found = set()
+        tail = ""
+        overlap = max(len("tool_call"), len(keyword)) - 1
+
+        def on_delta(delta: str) -> bool:
+            nonlocal tail
+            # Keep a short tail so markers split across chunks are still seen
+            window = tail + delta
+            found.update(cls.find_markers(window, keyword))
+            tail = window[-overlap:]
+            return len(found) == 3
+
+        return on_delta
+
+    async def generate_improvement(self, iteration: int) -> dict:
         """Generate self-improvement suggestion with current provider"""
         performance_log = f"""
-        Iteration: {self.iteration_count}
+        Iteration: {iteration}
         Current Score: {self.best_score:.2%}
         Provider: {self.agent.current_provider.value}
 
@@ -94,21 +174,38 @@ class SelfImprovingFramework:
         - Could improve error handling
         """
 
-        return self.agent.self_modify(performance_log)
+        return await self.agent.self_modify(performance_log)
 
-    def archive_agent(self, score: float):
+    def archive_agent(self, score: float, iteration: int):
         """Archive successful agent version"""
         archive_data = {
-            "iteration": self.iteration_count,
+            "iteration": iteration,
             "score": score,
             "provider": self.agent.current_provider.value,
             "timestamp": time.time(),
             "agent_config": "current_agent_version"
         }
 
-        archive_file = self.settings.ARCHIVE_DIR / f"agent_v{self.iteration_count}.json"
-        with open(archive_file, "w") as f:
-            json.dump(archive_data, f, indent=2)
+        archive_file = self.settings.ARCHIVE_DIR / f"agent_v{iteration}.json"
+        future = self._io_pool.submit(_write_json, archive_file, archive_data)
+        future.add_done_callback(_report_write_error)
+
+
+@lru_cache(maxsize=None)
+def _marker_pattern(keyword: str) -> re.Pattern:
+    """One alternation finds every scoring marker in a single pass without lowercasing content"""
+    return re.compile(f"def |tool_call|(?i:{re.escape(keyword)})")
+
+
+def _write_json(path: Path, data: dict):
+    path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+
+def _report_write_error(future: Future):
+    """Surface a failed background write instead of dropping it with the future"""
+    error = future.exception()
+    if error is not None:
+        print(f"❌ Archive write failed: {error}")
 
 
 def main():
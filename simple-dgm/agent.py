@@ -1,17 +1,43 @@
-import requests
+import atexit
 import json
+import logging
 import os
-from dotenv import load_dotenv
 import subprocess
 import tempfile
+import threading
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger("dgm.agent")
+
+# One keep-alive session to LM Studio shared by every agent and thread
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _load_env():
+    """Load environment variables once, on first use"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+def _get_session():
+    """Return the shared LM Studio session, creating it on first use"""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _SESSION = requests.Session()
+            _SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+            atexit.register(_SESSION.close)
+        return _SESSION
 
 class SimpleAgent:
     def __init__(self, code_dir):
         """Initialize the basic coding agent with LM Studio"""
+        _load_env()
         self.code_dir = code_dir
         self.base_url = "http://localhost:1234/v1"  # LM Studio default
         self.model_name = "deepseek/deepseek-r1-0528-qwen3-8b"
@@ -19,9 +45,9 @@ class SimpleAgent:
     def _call_lm_studio(self, messages, temperature=0.1, max_tokens=2000):
         """Call LM Studio API with OpenAI-compatible interface"""
         try:
-            response = requests.post(
+            response = _get_session().post(
                 f"{self.base_url}/chat/completions",
-                headers={"Content-Type": "application/json"},
+                headers={"Content-Type": "application/json", "Connection": "keep-alive"},
                 json={
                     "model": self.model_name,
                     "messages": messages,
@@ -42,8 +68,8 @@ class SimpleAgent:
     
     def solve_task(self, problem_description, repo_path=None):
         """Main function that solves a coding task"""
-        if repo_path:
-            self.code_dir = repo_path
+        # Local so concurrent evaluation tasks don't share a repository
+        code_dir = repo_path or self.code_dir
             
         prompt = f"""
 You are an expert software engineer. Analyze and solve this GitHub issue:
@@ -52,7 +78,7 @@ You are an expert software engineer. Analyze and solve this GitHub issue:
 {problem_description}
 
 ## Repository Location: 
-{self.code_dir}
+{code_dir}
 
 ## Available Tools:
 1. view_file(path) - View contents of a file
@@ -89,17 +115,19 @@ Please solve this step by step, explaining your reasoning, then provide the git
 
         # Always try to generate a git diff after the agent finishes
         try:
-            diff_cmd = f"cd {self.code_dir} && git diff"
-            import subprocess
-            result = subprocess.run(diff_cmd, shell=True, capture_output=True, text=True)
-
-            if result.returncode == 0 and result.stdout.strip():
-                response += f"\n\nGenerated git patch:\n```\n{result.stdout}\n```"
+            diff = self._git_diff(code_dir)
+            if diff.strip():
+                response += f"\n\nGenerated git patch:\n```\n{diff}\n```"
         except Exception as e:
-            print(f"Could not generate git diff: {e}")
+            logger.warning("Could not generate git diff: %s", e)
 
         return response
     
+    def _git_diff(self, code_dir):
+        """Run git diff in code_dir"""
+        result = subprocess.run(["git", "-C", str(code_dir), "diff"], capture_output=True, text=True)
+        return result.stdout if result.returncode == 0 else ""
+
     def self_modify(self, failure_logs, current_score):
         """Propose improvements to itself based on failures"""
         prompt = f"""
@@ -189,12 +217,19 @@ def run_command(command, cwd=None):
 def list_files(directory, max_depth=2):
     """List files in directory up to max_depth"""
     try:
-        result = subprocess.run(
-            f"find {directory} -maxdepth {max_depth} -type f | head -50",
-            shell=True,
-            capture_output=True,
-            text=True
-        )
-        return result.stdout.strip().split('\n') if result.stdout else []
+        files = []
+        queue = deque([(directory, 0)])
+        while queue and len(files) < 50:
+            path, depth = queue.popleft()
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth + 1 < max_depth:
+                            queue.append((entry.path, depth + 1))
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append(entry.path)
+                        if len(files) >= 50:
+                            break
+        return files
     except Exception as e:
         return [f"Error: {e}"]
\ No newline at end of file
@@ -1,40 +1,163 @@
+import hashlib
+import logging
 import sqlite3
-import json
 import os
+import queue
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, NamedTuple, Optional, Tuple, Any
+
+import orjson
+import zstandard as zstd
+
+sqlite3.register_converter("BOOLEAN", lambda b: b != b"0")
+
+logger = logging.getLogger("dgm.archive")
+
+
+class AgentScore(NamedTuple):
+    id: int
+    score: float
+
+
+class AgentSummary(NamedTuple):
+    id: int
+    score: float
+    created_at: str
+    parent_id: Optional[int]
+    description: str
+    is_functional: bool
+
 
 class SimpleArchive:
-    def __init__(self, db_path="archive/agents.db"):
+    # Most agents carry no metadata; store the same encoded literal for all of them
+    _EMPTY_META = b"{}"
+    
+    # Identical SQL text lets each pooled connection reuse its prepared statements
+    _SAVE_AGENT_SQL = """
+        INSERT INTO agents (score, parent_id, description, metadata, is_functional, code_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    _HAS_CODE_SQL = "SELECT 1 FROM agent_code WHERE code_hash = ?"
+    _SAVE_CODE_SQL = "INSERT OR IGNORE INTO agent_code (code_hash, code_zstd) VALUES (?, ?)"
+    _SAVE_PERF_SQL = "INSERT INTO performance_history (agent_id, test_name, score) VALUES (?, ?, ?)"
+    
+    # The [BOOLEAN] column-name hint makes sqlite3 hand back is_functional as a bool
+    _AGENT_COLUMNS = 'a.score, a.created_at, a.parent_id, a.description, a.metadata, a.is_functional AS "is_functional [BOOLEAN]", a.code_hash'
+    _COLUMN_SQL = {
+        "id": "a.id",
+        "code": "c.code_zstd AS code",
+        "score": "a.score",
+        "created_at": "a.created_at",
+        "parent_id": "a.parent_id",
+        "description": "a.description",
+        "metadata": "a.metadata",
+        "is_functional": 'a.is_functional AS "is_functional [BOOLEAN]"',
+        "code_hash": "a.code_hash",
+    }
+    
+    # Code is stored once per distinct content and shared by every agent that carries it
+    _AGENT_CODE_DDL = """
+        CREATE TABLE IF NOT EXISTS agent_code (
+            code_hash TEXT PRIMARY KEY,
+            code_zstd BLOB NOT NULL
+        )
+    """
+    
+    def __init__(self, db_path="archive/agents.db", pool_size=4):
         """Initialize the archive to store agent versions and their performance"""
         self.db_path = db_path
         
         # Create directory if it doesn't exist
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
         
+        # Long-lived connections keep SQLite's page cache warm between calls
+        self._pool = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        
         # Initialize database
         self.init_database()
         
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection for the pool"""
+        # Column-name hints only; PARSE_DECLTYPES would also turn created_at into datetimes
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                               detect_types=sqlite3.PARSE_COLNAMES)
+        conn.row_factory = sqlite3.Row
+        
+        # Must precede journal_mode=WAL on a fresh file; lets cleanup hand
+        # freed pages back to the filesystem
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        
+        # WAL lets evaluator reads proceed while save_agent writes; journal_mode
+        # persists in the file, the rest are per-connection settings
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MiB
+        conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        return conn
+        
+    @contextmanager
+    def _acquire(self):
+        """Borrow a pooled connection"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+            
+    @contextmanager
+    def _transaction(self, mode: str = "DEFERRED"):
+        """Borrow a pooled connection and run the block in one transaction"""
+        with self._acquire() as conn:
+            conn.execute(f"BEGIN {mode}")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            
+    def close(self):
+        """Close every idle pooled connection"""
+        pool = getattr(self, "_pool", None)
+        while pool is not None:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+                
+    def __del__(self):
+        self.close()
+        
     def init_database(self):
         """Create the database tables for storing agents"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        with self._transaction() as conn:
+            self._create_schema(conn.cursor())
+            
+    def _create_schema(self, cursor: sqlite3.Cursor):
+        """Create tables and indexes"""
         # Main agents table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS agents (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT NOT NULL,
                 score REAL NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 parent_id INTEGER,
                 description TEXT,
                 metadata TEXT,
-                is_functional BOOLEAN DEFAULT 1
+                is_functional BOOLEAN DEFAULT 1,
+                code_hash TEXT
             )
         """)
         
+        # Code lives out-of-row so ranking and aggregate scans stay on small pages
+        cursor.execute(self._AGENT_CODE_DDL)
+        
         # Performance history table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS performance_history (
@@ -51,205 +174,297 @@ class SimpleArchive:
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_score ON agents(score)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_created ON agents(created_at)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_parent ON agents(parent_id)")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_func_score_created
+            ON agents(is_functional, score DESC, created_at DESC, id)
+        """)
         
-        conn.commit()
-        conn.close()
+        self._migrate_code_storage(cursor)
         
+    def _migrate_code_storage(self, cursor: sqlite3.Cursor):
+        """Move code stored inline on agents into agent_code, keyed by content hash"""
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(agents)")]
+        if "code_hash" not in columns:
+            cursor.execute("ALTER TABLE agents ADD COLUMN code_hash TEXT")
+            
+        # Code stored inline on agents, from before agent_code existed
+        if "code" in columns:
+            rows = cursor.execute("SELECT id, code FROM agents").fetchall()
+            hashes = [(self.hash_code(code or ""), agent_id) for agent_id, code in rows]
+            blobs = {h: self._compress(code or "") for (h, _), (_, code) in zip(hashes, rows)}
+            cursor.executemany(self._SAVE_CODE_SQL, blobs.items())
+            cursor.executemany("UPDATE agents SET code_hash = ? WHERE id = ?", hashes)
+            cursor.execute("ALTER TABLE agents DROP COLUMN code")
+            logger.info("✓ Moved code for %d agents to agent_code", len(rows))
+            
+    @staticmethod
+    def hash_code(code: str) -> str:
+        """Content hash that identifies an agent's code in agent_code"""
+        return hashlib.blake2b(code.encode('utf-8'), digest_size=16).hexdigest()
+        
+    @staticmethod
+    def _compress(code: str) -> bytes:
+        return zstd.compress(code.encode('utf-8'), 3)
+        
+    @staticmethod
+    def _decompress(blob: Optional[bytes]) -> Optional[str]:
+        return zstd.decompress(blob).decode('utf-8') if blob is not None else None
+        
+    @staticmethod
+    def _code_select(include_code: bool) -> Tuple[str, str]:
+        """Column and join for reading an agent's code"""
+        if include_code:
+            return "c.code_zstd AS code, ", "LEFT JOIN agent_code c ON c.code_hash = a.code_hash"
+        return "", ""
+        
+    @classmethod
+    def _row_to_agent(cls, row: sqlite3.Row) -> Dict:
+        """Convert an agents row to a dict"""
+        d = dict(row)
+        if 'code' in d:
+            d['code'] = cls._decompress(d['code'])
+        if 'metadata' in d:
+            d['metadata'] = orjson.loads(d['metadata']) if d['metadata'] else {}
+        return d
+        
+    def _store_code(self, conn: sqlite3.Connection, code: str, code_hash: str):
+        """Compress and store code unless its hash is already archived"""
+        if conn.execute(self._HAS_CODE_SQL, (code_hash,)).fetchone() is None:
+            conn.execute(self._SAVE_CODE_SQL, (code_hash, self._compress(code)))
+            
     def save_agent(self, code: str, score: float, parent_id: Optional[int] = None, 
-                   description: str = "", metadata: Dict = None, is_functional: bool = True) -> int:
-        """Save a new agent version to the archive"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+                   description: str = "", metadata: Dict = None, is_functional: bool = True,
+                   code_hash: Optional[str] = None) -> int:
+        """
+        Save a new agent version to the archive
+        Pass code_hash (from hash_code) when the caller already has it
+        """
+        code_hash = code_hash or self.hash_code(code)
         
-        metadata_json = json.dumps(metadata or {})
+        with self._transaction() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("""
-            INSERT INTO agents (code, score, parent_id, description, metadata, is_functional)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (code, score, parent_id, description, metadata_json, is_functional))
+            metadata_json = self._EMPTY_META if not metadata else orjson.dumps(metadata)
         
-        agent_id = cursor.lastrowid
+            cursor.execute(self._SAVE_AGENT_SQL, (score, parent_id, description, metadata_json, is_functional, code_hash))
         
-        # Also save to performance history
-        cursor.execute("""
-            INSERT INTO performance_history (agent_id, test_name, score)
-            VALUES (?, ?, ?)
-        """, (agent_id, "main_benchmark", score))
+            agent_id = cursor.lastrowid
+            
+            # Agents whose code matches an ancestor's only reference the stored copy
+            self._store_code(conn, code, code_hash)
         
-        conn.commit()
-        conn.close()
+            # Also save to performance history
+            cursor.execute(self._SAVE_PERF_SQL, (agent_id, "main_benchmark", score))
         
-        print(f"✓ Saved agent {agent_id} with score {score:.3f}")
+        logger.info("✓ Saved agent %d with score %.3f", agent_id, score)
         return agent_id
         
-    def get_agent(self, agent_id: int) -> Optional[Dict]:
+    def save_agents_bulk(self, rows: List[Tuple]) -> List[int]:
+        """
+        Save many agents in a single transaction
+        Each row is (code, score, parent_id, description, metadata, is_functional)
+        """
+        if not rows:
+            return []
+            
+        code_hashes = [self.hash_code(row[0]) for row in rows]
+        params = [
+            (score, parent_id, description, self._EMPTY_META if not metadata else orjson.dumps(metadata),
+             is_functional, code_hash)
+            for (code, score, parent_id, description, metadata, is_functional), code_hash in zip(rows, code_hashes)
+        ]
+        
+        with self._transaction() as conn:
+            conn.executemany(self._SAVE_AGENT_SQL, params)
+            
+            # Rows inserted in one write transaction get consecutive ids
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            agent_ids = list(range(last_id - len(params) + 1, last_id + 1))
+            
+            # One stored copy per distinct code in the batch
+            for code_hash, code in dict(zip(code_hashes, (row[0] for row in rows))).items():
+                self._store_code(conn, code, code_hash)
+            conn.executemany(
+                self._SAVE_PERF_SQL,
+                [(agent_id, "main_benchmark", row[0]) for agent_id, row in zip(agent_ids, params)]
+            )
+            
+        logger.info("✓ Saved %d agents in bulk", len(agent_ids))
+        return agent_ids
+        
+    def save_performance(self, agent_id: int, results: List[Tuple[str, float]]):
+        """Record several (test_name, score) results for an agent in one transaction"""
+        if not results:
+            return
+            
+        with self._transaction() as conn:
+            conn.executemany(
+                self._SAVE_PERF_SQL,
+                [(agent_id, test_name, score) for test_name, score in results]
+            )
+        
+    def get_agent(self, agent_id: int, include_code: bool = True) -> Optional[Dict]:
         """Get a specific agent by ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._acquire() as conn:
+            cursor = conn.cursor()
+            code_col, code_join = self._code_select(include_code)
         
-        cursor.execute("""
-            SELECT id, code, score, created_at, parent_id, description, metadata, is_functional
-            FROM agents WHERE id = ?
-        """, (agent_id,))
+            cursor.execute(f"""
+                SELECT a.id, {code_col}{self._AGENT_COLUMNS}
+                FROM agents a {code_join}
+                WHERE a.id = ?
+            """, (agent_id,))
         
-        result = cursor.fetchone()
-        conn.close()
+            result = cursor.fetchone()
         
         if result:
-            return {
-                'id': result[0],
-                'code': result[1], 
-                'score': result[2],
-                'created_at': result[3],
-                'parent_id': result[4],
-                'description': result[5],
-                'metadata': json.loads(result[6] or '{}'),
-                'is_functional': bool(result[7])
-            }
+            return self._row_to_agent(result)
         return None
         
-    def get_best_agent(self) -> Optional[Dict]:
+    def get_best_agent(self, include_code: bool = True) -> Optional[Dict]:
         """Get the agent with the highest score"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, code, score, created_at, parent_id, description, metadata, is_functional
-            FROM agents 
-            WHERE is_functional = 1
-            ORDER BY score DESC, created_at DESC 
-            LIMIT 1
-        """)
+        with self._acquire() as conn:
+            cursor = conn.cursor()
+        
+            code_col, code_join = self._code_select(include_code)
+        
+            # Rank on the covering index, then read only the winning row
+            cursor.execute(f"""
+                SELECT a.id, {code_col}{self._AGENT_COLUMNS}
+                FROM agents a {code_join}
+                WHERE a.id = (
+                    SELECT id FROM agents
+                    WHERE is_functional = 1
+                    ORDER BY score DESC, created_at DESC
+                    LIMIT 1
+                )
+            """)
         
-        result = cursor.fetchone()
-        conn.close()
+            result = cursor.fetchone()
         
         if result:
-            return {
-                'id': result[0],
-                'code': result[1],
-                'score': result[2], 
-                'created_at': result[3],
-                'parent_id': result[4],
-                'description': result[5],
-                'metadata': json.loads(result[6] or '{}'),
-                'is_functional': bool(result[7])
-            }
+            return self._row_to_agent(result)
         return None
         
-    def get_all_agents(self, functional_only: bool = True) -> List[Dict]:
-        """Get all agents, optionally filtered by functionality"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if functional_only:
-            cursor.execute("""
-                SELECT id, code, score, created_at, parent_id, description, metadata, is_functional
-                FROM agents 
-                WHERE is_functional = 1
-                ORDER BY created_at DESC
-            """)
+    def get_all_agents(self, functional_only: bool = True, include_code: bool = True,
+                       columns: Tuple[str, ...] = ("*",)) -> List[Dict]:
+        """
+        Get all agents, optionally filtered by functionality
+        Pass columns to read only those fields; code and metadata are decoded only when selected
+        """
+        if columns == ("*",):
+            code_col, code_join = self._code_select(include_code)
+            select = f"a.id, {code_col}{self._AGENT_COLUMNS}"
         else:
-            cursor.execute("""
-                SELECT id, code, score, created_at, parent_id, description, metadata, is_functional  
-                FROM agents
-                ORDER BY created_at DESC
-            """)
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        agents = []
-        for result in results:
-            agents.append({
-                'id': result[0],
-                'code': result[1],
-                'score': result[2],
-                'created_at': result[3], 
-                'parent_id': result[4],
-                'description': result[5],
-                'metadata': json.loads(result[6] or '{}'),
-                'is_functional': bool(result[7])
-            })
-        
-        return agents
-        
-    def get_top_agents(self, n: int = 5) -> List[Dict]:
+            select, code_join = self._select_columns(columns)
+            
+        return [self._row_to_agent(result) for result in self._fetch_agents(select, code_join, functional_only)]
+        
+    def get_agent_ids_scores(self, functional_only: bool = True) -> List[AgentScore]:
+        """Get (id, score) for every agent, newest first"""
+        select, code_join = self._select_columns(AgentScore._fields)
+        return [AgentScore._make(row) for row in self._fetch_agents(select, code_join, functional_only)]
+        
+    def get_agent_summaries(self, functional_only: bool = True) -> List[AgentSummary]:
+        """Get every agent without code or metadata, newest first"""
+        select, code_join = self._select_columns(AgentSummary._fields)
+        return [AgentSummary._make(row) for row in self._fetch_agents(select, code_join, functional_only)]
+        
+    def _select_columns(self, columns: Tuple[str, ...]) -> Tuple[str, str]:
+        """Select list and join for a subset of agent columns"""
+        unknown = set(columns) - self._COLUMN_SQL.keys()
+        if unknown:
+            raise ValueError(f"Unknown agent columns: {sorted(unknown)}")
+            
+        code_join = self._code_select(True)[1] if "code" in columns else ""
+        return ", ".join(self._COLUMN_SQL[column] for column in columns), code_join
+        
+    def _fetch_agents(self, select: str, code_join: str, functional_only: bool) -> List[sqlite3.Row]:
+        """Run an all-agents query, newest first"""
+        where = "WHERE a.is_functional = 1" if functional_only else ""
+        with self._acquire() as conn:
+            return conn.execute(f"""
+                SELECT {select}
+                FROM agents a {code_join}
+                {where}
+                ORDER BY a.created_at DESC
+            """).fetchall()
+        
+    def get_top_agents(self, n: int = 5, include_code: bool = True) -> List[Dict]:
         """Get the top N performing agents"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._acquire() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT id, code, score, created_at, parent_id, description, metadata, is_functional
-            FROM agents 
-            WHERE is_functional = 1
-            ORDER BY score DESC, created_at DESC
-            LIMIT ?
-        """, (n,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        agents = []
-        for result in results:
-            agents.append({
-                'id': result[0],
-                'code': result[1],
-                'score': result[2],
-                'created_at': result[3],
-                'parent_id': result[4], 
-                'description': result[5],
-                'metadata': json.loads(result[6] or '{}'),
-                'is_functional': bool(result[7])
-            })
-        
-        return agents
-        
-    def get_lineage(self, agent_id: int) -> List[Dict]:
-        """Get the lineage (ancestry) of an agent"""
-        lineage = []
-        current_id = agent_id
-        
-        while current_id is not None:
-            agent = self.get_agent(current_id)
-            if agent:
-                lineage.append(agent)
-                current_id = agent['parent_id']
-            else:
-                break
-                
-        return lineage
-        
-    def get_statistics(self) -> Dict:
-        """Get archive statistics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+            code_col, code_join = self._code_select(include_code)
         
-        # Total agents
-        cursor.execute("SELECT COUNT(*) FROM agents")
-        total_agents = cursor.fetchone()[0]
+            # Rank on the covering index, then read only the top N rows
+            cursor.execute(f"""
+                SELECT a.id, {code_col}{self._AGENT_COLUMNS}
+                FROM agents a {code_join}
+                WHERE a.id IN (
+                    SELECT id FROM agents
+                    WHERE is_functional = 1
+                    ORDER BY score DESC, created_at DESC
+                    LIMIT ?
+                )
+                ORDER BY a.score DESC, a.created_at DESC
+            """, (n,))
         
-        # Functional agents
-        cursor.execute("SELECT COUNT(*) FROM agents WHERE is_functional = 1")
-        functional_agents = cursor.fetchone()[0]
+            results = cursor.fetchall()
         
-        # Best score
-        cursor.execute("SELECT MAX(score) FROM agents WHERE is_functional = 1")
-        best_score = cursor.fetchone()[0] or 0.0
+        return [self._row_to_agent(result) for result in results]
         
-        # Average score
-        cursor.execute("SELECT AVG(score) FROM agents WHERE is_functional = 1")
-        avg_score = cursor.fetchone()[0] or 0.0
-        
-        # Score improvement over time
-        cursor.execute("""
-            SELECT created_at, score FROM agents 
-            WHERE is_functional = 1 
-            ORDER BY created_at ASC
-        """)
-        score_history = cursor.fetchall()
+    def get_lineage(self, agent_id: int, include_code: bool = True) -> List[Dict]:
+        """Get the lineage (ancestry) of an agent"""
+        with self._acquire() as conn:
+            cursor = conn.cursor()
+            code_col, code_join = self._code_select(include_code)
+            
+            # Walk parent links in SQL, ordered from the agent up to its root
+            cursor.execute(f"""
+                WITH RECURSIVE anc(id, depth) AS (
+                    SELECT ?, 0
+                    UNION ALL
+                    SELECT a.parent_id, anc.depth + 1
+                    FROM agents a JOIN anc ON a.id = anc.id
+                    WHERE a.parent_id IS NOT NULL
+                )
+                SELECT a.id, {code_col}{self._AGENT_COLUMNS}
+                FROM agents a JOIN anc ON a.id = anc.id {code_join}
+                ORDER BY anc.depth
+            """, (agent_id,))
+            
+            results = cursor.fetchall()
+            
+        return [self._row_to_agent(result) for result in results]
         
-        conn.close()
+    def get_statistics(self, include_history: bool = True) -> Dict:
+        """Get archive statistics, optionally with the full score history"""
+        with self._acquire() as conn:
+            cursor = conn.cursor()
+            
+            # Counts, best and average score in a single pass
+            cursor.execute("""
+                SELECT COUNT(*),
+                       SUM(is_functional),
+                       MAX(CASE WHEN is_functional THEN score END),
+                       AVG(CASE WHEN is_functional THEN score END)
+                FROM agents
+            """)
+            total_agents, functional_agents, best_score, avg_score = cursor.fetchone()
+            functional_agents = functional_agents or 0
+            best_score = best_score or 0.0
+            avg_score = avg_score or 0.0
+            
+            # Score improvement over time
+            score_history = []
+            if include_history:
+                cursor.execute("""
+                    SELECT created_at, score FROM agents 
+                    WHERE is_functional = 1 
+                    ORDER BY created_at ASC
+                """)
+                score_history = [tuple(row) for row in cursor.fetchall()]
         
         return {
             'total_agents': total_agents,
@@ -265,16 +480,8 @@ class SimpleArchive:
         Select parent agents for the next generation
         Based on DGM paper's selection strategy
         """
-        functional_agents = self.get_all_agents(functional_only=True)
-        
-        if not functional_agents:
-            return []
-            
-        if len(functional_agents) < k:
-            return functional_agents
-        else:
-            sorted_agents = sorted(functional_agents, key=lambda x: x["score"], reverse=True)
-            return sorted_agents[:k]
+        # Top-k straight off the covering index; only k rows are read
+        return self.get_top_agents(n=k)
         
     def export_best_agent(self, output_path: str):
         """Export the best agent to a file"""
@@ -286,34 +493,50 @@ class SimpleArchive:
                 f.write(f"# Created: {best_agent['created_at']}\n") 
                 f.write(f"# Description: {best_agent['description']}\n\n")
                 f.write(best_agent['code'])
-            print(f"✓ Exported best agent to {output_path}")
+            logger.info("✓ Exported best agent to %s", output_path)
         else:
-            print("✗ No agents found to export")
+            logger.warning("✗ No agents found to export")
             
     def cleanup_old_agents(self, keep_n: int = 100):
         """Keep only the best N agents to manage database size"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Take the write lock up front so a concurrent writer can't deadlock the purge
+        with self._transaction("IMMEDIATE") as conn:
+            cursor = conn.cursor()
         
-        # Keep top N functional agents and all non-functional ones
-        cursor.execute("""
-            DELETE FROM agents 
-            WHERE id NOT IN (
-                SELECT id FROM agents 
-                WHERE is_functional = 1 
-                ORDER BY score DESC 
-                LIMIT ?
-            ) AND is_functional = 1
-        """, (keep_n,))
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+            # Keep top N functional agents and all non-functional ones; the
+            # keep-set is ranked once on the covering index
+            cursor.execute("""
+                WITH keep AS (
+                    SELECT id FROM agents
+                    WHERE is_functional = 1
+                    ORDER BY score DESC, created_at DESC
+                    LIMIT ?
+                )
+                DELETE FROM agents
+                WHERE is_functional = 1 AND id NOT IN (SELECT id FROM keep)
+            """, (keep_n,))
+        
+            deleted_count = cursor.rowcount
+            
+            # Drop rows left behind by deleted agents; code goes once no agent shares it
+            cursor.execute("""
+                DELETE FROM agent_code
+                WHERE code_hash NOT IN (SELECT code_hash FROM agents WHERE code_hash IS NOT NULL)
+            """)
+            cursor.execute("""
+                DELETE FROM performance_history
+                WHERE agent_id NOT IN (SELECT id FROM agents)
+            """)
         
         if deleted_count > 0:
-            print(f"✓ Cleaned up {deleted_count} old agents")
+            with self._acquire() as conn:
+                # executescript steps the pragma to completion; execute() frees one page
+                conn.executescript("PRAGMA incremental_vacuum;")
+            logger.info("✓ Cleaned up %d old agents", deleted_count)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     # Test the archive system
     archive = SimpleArchive()
     
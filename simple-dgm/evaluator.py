@@ -1,101 +1,140 @@
+import logging
+import math
 import os
+import sqlite3
+import subprocess
 import tempfile
-import shutil
-from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from typing import Dict, List, Optional, Tuple
-import json
 import time
 import re
-from swe_bench_loader import swe_bench
+from datetime import datetime
+
+import orjson
+
+from swe_bench_loader import SWEInstance, swe_bench
+
+logger = logging.getLogger("dgm.evaluator")
+
+# Fenced block holding a patch, with or without a diff language tag; the patch
+# keeps its final newline, without which git apply reports a corrupt patch
+_DIFF_RE = re.compile(r'```(?:diff)?\n((?:diff --git|--- ).*?\n)```', re.DOTALL)
+# Everything from the first "diff --git" line to the end of the text
+_GIT_DIFF_RE = re.compile(r'^diff --git.*\Z', re.MULTILINE | re.DOTALL)
+
+
+def _truncate(s: str, n: int = 500) -> str:
+    return s if len(s) <= n else f"{s[:n]}..."
 
 
 class SWEBenchEvaluator:
-    def __init__(self, max_instances=20):
+    _SAVE_RESULT_SQL = """
+        INSERT INTO evaluation_history (run_id, iteration, instance_id, success, score, reason, elapsed_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+    
+    def __init__(self, max_instances=20, history_size=500, db_path="framework.db", run_id=None):
         """Initialize evaluator with SWE-bench data"""
         self.max_instances = max_instances
-        self.current_instances = []
-        self.results_history = []
-        
-        # Load SWE-bench data
-        success = swe_bench.load_swe_bench_verified(max_instances=max_instances)
-        if success:
-            self.current_instances = swe_bench.current_instances
-            print(f"✅ Loaded {len(self.current_instances)} SWE-bench instances")
-        else:
-            print("❌ Failed to load SWE-bench data")
+        
+        # Recent evaluations stay in memory; every task result is also appended
+        # to evaluation_history in db_path so the full record survives the ring
+        # buffer and restarts. Rows are tagged with run_id; earlier runs are kept
+        self.results_history = deque(maxlen=history_size)
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS evaluation_history (
+                run_id TEXT,
+                iteration INTEGER,
+                instance_id TEXT,
+                success INTEGER,
+                score REAL,
+                reason TEXT,
+                elapsed_time REAL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_eval_run_iteration ON evaluation_history(run_id, iteration)")
+        
+        # Scores for the improvement window, and metrics memoized per evaluation count
+        self._recent_scores = deque(maxlen=10)
+        self._evaluation_count = 0
+        self._metrics_cache: Optional[Tuple[int, Dict]] = None
+        
+        # Only the first max_instances rows are read, from the local cache when warm
+        try:
+            swe_bench.iter_instances(limit=max_instances)
+            logger.info("✅ Loaded %d SWE-bench instances", len(swe_bench.current_instances))
+        except Exception as e:
+            logger.error("❌ Failed to load SWE-bench data: %s", e)
             
-    def evaluate_agent(self, agent, num_tasks=10, timeout=300):
+    def evaluate_agent(self, agent, num_tasks=10, timeout=300, max_workers=None, iteration=None):
         """
         Evaluate agent on SWE-bench tasks
+        Up to max_workers tasks run at once (default: one per CPU); each gets
+        timeout seconds from the moment it starts running. Results are stored
+        under the caller's iteration, or the evaluation number when none is given
         """
-        if not self.current_instances:
-            print("No SWE-bench instances available")
+        instances = swe_bench.current_instances[:num_tasks]
+        if not instances:
+            logger.warning("No SWE-bench instances available")
             return 0.0
         
-        num_tasks = min(num_tasks, len(self.current_instances))
+        num_tasks = len(instances)
         passed = 0
         results = []
         
-        print(f"\n=== Evaluating Agent on {num_tasks} SWE-bench Tasks ===")
+        logger.info("\n=== Evaluating Agent on %d SWE-bench Tasks ===", num_tasks)
+        
+        # Tasks are independent and spend their time in git, pytest and the
+        # model server, so threads overlap them without pickling the agent
+        workers = min(num_tasks, max_workers or os.cpu_count() or 1)
+        pool = ThreadPoolExecutor(max_workers=workers)
         
-        for i in range(num_tasks):
-            instance = self.current_instances[i]
-            instance_id = instance['instance_id']
-            problem = instance['problem_statement']
+        # Queued tasks start their clock when a worker picks them up; the overall
+        # deadline is what every task using its full budget would take, so a task
+        # stuck behind timed-out ones still gets abandoned
+        started: Dict[int, float] = {}
+        
+        def run(i: int, instance: SWEInstance) -> Dict:
+            started[i] = time.monotonic()
+            return self._evaluate_one(instance, agent)
             
-            print(f"\n🔍 Task {i+1}/{num_tasks}: {instance_id}")
-            print(f"Repository: {instance['repo']}")
+        deadline = time.monotonic() + timeout * math.ceil(num_tasks / workers)
+        futures = [pool.submit(run, i, instance) for i, instance in enumerate(instances)]
+        
+        for i, (instance, future) in enumerate(zip(instances, futures)):
+            logger.info("\n🔍 Task %d/%d: %s", i + 1, num_tasks, instance.instance_id)
+            logger.info("Repository: %s", instance.repo)
             
-            try:
-                start_time = time.time()
-                
-                # Setup repository
-                repo_dir = swe_bench.setup_repository(instance)
-                
-                # Run agent on the problem
-                solution = agent.solve_task(problem, repo_dir)
-                
-                # Extract patch from solution (simplified)
-                patch = self.extract_patch_from_solution(solution, repo_dir)
-                
-                # Evaluate the patch
-                evaluation = swe_bench.evaluate_patch(repo_dir, patch, instance)
-                
-                elapsed_time = time.time() - start_time
-                
+            result = self._await_task(future, started, i, timeout, deadline)
+            if result is None:
                 result = {
-                    "instance_id": instance_id,
-                    "repo": instance['repo'],
-                    "success": evaluation["success"],
-                    "score": evaluation["score"],
-                    "reason": evaluation["reason"],
-                    "elapsed_time": elapsed_time,
-                    "solution": solution[:500] + "..." if len(solution) > 500 else solution
-                }
-                
-                results.append(result)
-                
-                if evaluation["success"]:
-                    passed += 1
-                    print(f"✅ PASSED: {evaluation['reason']}")
-                else:
-                    print(f"❌ FAILED: {evaluation['reason']}")
-                
-                print(f"⏱️  Time: {elapsed_time:.1f}s")
-                
-                # Cleanup
-                if Path(repo_dir).exists():
-                    shutil.rmtree(repo_dir)
-                    
-            except Exception as e:
-                print(f"❌ ERROR: {str(e)}")
-                results.append({
-                    "instance_id": instance_id,
+                    "instance_id": instance.instance_id,
                     "success": False,
                     "score": 0.0,
-                    "reason": f"Exception: {str(e)}",
-                    "elapsed_time": 0
-                })
+                    "reason": f"Timed out after {timeout}s",
+                    "elapsed_time": timeout
+                }
+            
+            results.append(result)
+            
+            if result["success"]:
+                passed += 1
+                logger.info("✅ PASSED: %s", result['reason'])
+            elif result["reason"].startswith("Exception: "):
+                logger.info("❌ ERROR: %s", result['reason'][len('Exception: '):])
+            else:
+                logger.info("❌ FAILED: %s", result['reason'])
+            
+            logger.info("⏱️  Time: %.1fs", result['elapsed_time'])
+        
+        # Don't let a timed-out task hold up the caller
+        pool.shutdown(wait=False, cancel_futures=True)
                 
         score = passed / num_tasks if num_tasks > 0 else 0.0
         
@@ -109,67 +148,120 @@ class SWEBenchEvaluator:
         }
         
         self.results_history.append(evaluation_result)
+        if iteration is None:
+            iteration = self._evaluation_count
+        self.db.executemany(self._SAVE_RESULT_SQL, [
+            (self.run_id, iteration, r["instance_id"], r["success"], r["score"], r["reason"], r["elapsed_time"])
+            for r in results
+        ])
+        self._recent_scores.append(score)
+        self._evaluation_count += 1
         
-        print(f"\n=== Final Score: {score:.2%} ({passed}/{num_tasks}) ===")
+        logger.info("\n=== Final Score: %.2f%% (%d/%d) ===", score * 100, passed, num_tasks)
         return score
     
+    @staticmethod
+    def _await_task(future, started: Dict[int, float], i: int, timeout: float, deadline: float) -> Optional[Dict]:
+        """Wait for a task's result until it has run for timeout seconds; None if it didn't finish"""
+        while True:
+            now = time.monotonic()
+            start = started.get(i)
+            task_deadline = deadline if start is None else min(deadline, start + timeout)
+            try:
+                # Re-check at most every timeout seconds, so a task that starts meanwhile gets its own bound
+                return future.result(timeout=max(0.0, min(task_deadline - now, timeout)))
+            except FuturesTimeout:
+                if time.monotonic() >= task_deadline:
+                    return None
+                    
+    def _evaluate_one(self, instance: SWEInstance, agent) -> Dict:
+        """Run the agent on one instance and score its patch"""
+        start_time = time.time()
+        repo_dir = None
+        
+        try:
+            # Lease a worktree from the loader's repo cache
+            repo_dir = swe_bench.setup_repository(instance)
+            
+            # Run agent on the problem
+            solution = agent.solve_task(instance.problem_statement, repo_dir)
+            
+            # Extract patch from solution (simplified)
+            patch = self.extract_patch_from_solution(solution, repo_dir)
+            
+            # Only the excerpt is kept; drop the full text before the tests run
+            solution = _truncate(solution)
+            
+            # Evaluate the patch
+            evaluation = swe_bench.evaluate_patch(repo_dir, patch, instance)
+            
+            return {
+                "instance_id": instance.instance_id,
+                "repo": instance.repo,
+                "success": evaluation["success"],
+                "score": evaluation["score"],
+                "reason": evaluation["reason"],
+                "elapsed_time": time.time() - start_time,
+                "solution": solution
+            }
+            
+        except Exception as e:
+            return {
+                "instance_id": instance.instance_id,
+                "success": False,
+                "score": 0.0,
+                "reason": f"Exception: {str(e)}",
+                "elapsed_time": 0
+            }
+        finally:
+            if repo_dir is not None:
+                swe_bench.release_repository(repo_dir)
+    
     def extract_patch_from_solution(self, solution: str, repo_dir: str) -> str:
         """
         Extract git patch from agent solution with multiple fallback strategies
         """
         try:
             # Strategy 1: Look for diff blocks in the solution
-            diff_pattern = r'``````'
-            diff_matches = re.findall(diff_pattern, solution, re.DOTALL)
-            if diff_matches:
-                print("Found diff block in solution")
-                return diff_matches[0]
+            match = _DIFF_RE.search(solution)
+            if match:
+                logger.info("Found diff block in solution")
+                return match.group(1)
 
             # Strategy 2: Look for any diff content starting with "diff --git"
-            lines = solution.split('\n')
-            diff_lines = []
-            in_diff = False
-
-            for line in lines:
-                if line.startswith('diff --git'):
-                    in_diff = True
-                if in_diff:
-                    diff_lines.append(line)
-
-            if diff_lines:
-                print("Found git diff in solution text")
-                return '\n'.join(diff_lines)
+            match = _GIT_DIFF_RE.search(solution)
+            if match:
+                logger.info("Found git diff in solution text")
+                return match.group(0)
 
             # Strategy 3: Generate git diff from current changes
-            diff_cmd = f"cd {repo_dir} && git diff"
-            import subprocess
-            result = subprocess.run(diff_cmd, shell=True, capture_output=True, text=True)
+            result = subprocess.run(["git", "diff"], cwd=repo_dir, capture_output=True, text=True, check=False)
 
             if result.returncode == 0 and result.stdout.strip():
-                print("Generated git diff from current state")
+                logger.info("Generated git diff from current state")
                 return result.stdout
 
             # Strategy 4: Check if there are any unstaged changes
-            status_cmd = f"cd {repo_dir} && git status --porcelain"
-            status_result = subprocess.run(status_cmd, shell=True, capture_output=True, text=True)
+            status_result = subprocess.run(["git", "status", "--porcelain"], cwd=repo_dir,
+                                           capture_output=True, text=True, check=False)
 
-            if status_result.stdout.strip():
-                print("Found unstaged changes, generating diff")
+            if status_result.returncode == 0 and status_result.stdout.strip():
+                logger.info("Found unstaged changes, generating diff")
                 # Add all changes and create diff
-                add_cmd = f"cd {repo_dir} && git add -A"
-                subprocess.run(add_cmd, shell=True)
+                add_result = subprocess.run(["git", "add", "-A"], cwd=repo_dir, capture_output=True, check=False)
 
-                diff_cached_cmd = f"cd {repo_dir} && git diff --cached"
-                cached_result = subprocess.run(diff_cached_cmd, shell=True, capture_output=True, text=True)
+                if add_result.returncode == 0:
+                    cached_result = subprocess.run(["git", "diff", "--cached"], cwd=repo_dir,
+                                                   capture_output=True, text=True, check=False)
 
-                if cached_result.returncode == 0:
-                    return cached_result.stdout
+                    if cached_result.returncode == 0:
+                        return cached_result.stdout
 
-            print("No patch could be extracted - agent may not have made changes")
+            logger.info("No patch could be extracted - agent may not have made changes")
             return ""
 
         except Exception as e:
-            print(f"Error extracting patch: {e}")
+            logger.warning("Error extracting patch: %s", e)
             return ""
     
     def is_agent_functional(self, agent) -> Tuple[bool, str]:
@@ -188,11 +280,15 @@ class SWEBenchEvaluator:
     
     def get_improvement_metrics(self) -> Dict:
         """Get metrics showing improvement over time"""
-        if len(self.results_history) < 2:
+        if self._evaluation_count < 2:
             return {"improvement": 0.0, "trend": "insufficient_data"}
         
-        recent_scores = [r["score"] for r in self.results_history[-5:]]
-        earlier_scores = [r["score"] for r in self.results_history[-10:-5]] if len(self.results_history) >= 10 else [self.results_history[-1]["score"]]
+        if self._metrics_cache and self._metrics_cache[0] == self._evaluation_count:
+            return self._metrics_cache[1]
+        
+        scores = list(self._recent_scores)
+        recent_scores = scores[-5:]
+        earlier_scores = scores[-10:-5] if self._evaluation_count >= 10 else scores[-1:]
         
         recent_avg = sum(recent_scores) / len(recent_scores)
         earlier_avg = sum(earlier_scores) / len(earlier_scores)
@@ -200,24 +296,42 @@ class SWEBenchEvaluator:
         improvement = recent_avg - earlier_avg
         trend = "improving" if improvement > 0.01 else "declining" if improvement < -0.01 else "stable"
         
-        return {
+        metrics = {
             "improvement": improvement,
             "trend": trend,
             "recent_avg": recent_avg,
             "earlier_avg": earlier_avg,
-            "total_evaluations": len(self.results_history)
+            "total_evaluations": self._evaluation_count
         }
+        self._metrics_cache = (self._evaluation_count, metrics)
+        return metrics
+    
+    def load_history(self, limit: int = 1000) -> List[Dict]:
+        """Read back the latest task results of this run, newest first"""
+        cursor = self.db.execute("""
+            SELECT iteration, instance_id, success, score, reason, elapsed_time
+            FROM evaluation_history
+            WHERE run_id = ?
+            ORDER BY iteration DESC, rowid DESC
+            LIMIT ?
+        """, (self.run_id, limit))
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
     
     def export_results(self, filename="swe_bench_results.json"):
         """Export all evaluation results"""
-        with open(filename, 'w') as f:
-            json.dump({
-                "evaluation_history": self.results_history,
-                "summary": self.get_improvement_metrics()
-            }, f, indent=2)
-        print(f"📊 Results exported to {filename}")
+        payload = orjson.dumps({
+            "run_id": self.run_id,
+            "evaluation_history": self.load_history(),
+            "summary": self.get_improvement_metrics()
+        }, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+        with open(filename, 'wb') as f:
+            f.write(payload)
+        logger.info("📊 Results exported to %s", filename)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     # Test the evaluator
     from agent import SimpleAgent
     
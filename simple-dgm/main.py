@@ -1,60 +1,115 @@
+import logging
 import os
+import random
 import time
-import json
 import signal
+import sqlite3
 import sys
+import threading
 from datetime import datetime
 from typing import Dict, List
-import traceback
+from collections import deque
+from itertools import islice
+from logging.handlers import MemoryHandler
 
-# Import our components
-from agent import SimpleAgent
-from archive import SimpleArchive
-from evaluator import SWEBenchEvaluator
-from swe_bench_loader import swe_bench
+import orjson
+
+logger = logging.getLogger("dgm")
+
+
+def setup_logging(capacity: int = 100):
+    """Send dgm log records to stdout in batches of up to capacity"""
+    handler = MemoryHandler(capacity=capacity, target=logging.StreamHandler(sys.stdout))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def flush_logs():
+    """Write out buffered records now rather than when the buffer fills"""
+    for handler in logger.handlers:
+        handler.flush()
 
 class InfiniteSelfImprovingFramework:
-    def __init__(self):
+    def __init__(self, max_workers=None, db_path="framework.db"):
+        # Components are imported on first use so importing this module stays cheap
+        from archive import SimpleArchive
+        from evaluator import SWEBenchEvaluator
+        
         self.archive = SimpleArchive()
-        self.evaluator = SWEBenchEvaluator(max_instances=30)
+        self.run_id = f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self.evaluator = SWEBenchEvaluator(max_instances=30, db_path=db_path, run_id=self.run_id)
+        self.max_workers = max_workers
         self.running = True
         
         # Performance tracking
         self.iteration = 0
         self.best_score = 0.0
-        self.improvement_log = []
+        self._recent_scores = deque(maxlen=10)
+        self._start_time = None
+        
+        # Pacing: no pause while iterations succeed, a short one for a few
+        # iterations after an error, exponential backoff on repeated errors
+        self._consecutive_errors = 0
+        self._last_error_iteration = None
+        self.pace_seconds = 10
+        self.pace_iterations_after_error = 3
         
-        print("🚀 Infinite Self-Improving Framework with SWE-bench")
-        print("🤖 Model: DeepSeek R1 on LM Studio")
-        print("📊 Benchmark: SWE-bench Verified")
-        print("🔄 Mode: Continuous Self-Improvement")
+        # Append-only improvement log, one row per iteration, next to the
+        # evaluator's evaluation_history; checkpoints point at the database
+        # instead of re-serializing the whole trajectory
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS improvement_log (
+                run_id TEXT,
+                iteration INTEGER,
+                score REAL,
+                ts TEXT,
+                description TEXT,
+                PRIMARY KEY (run_id, iteration)
+            )
+        """)
+        
+        logger.info("🚀 Infinite Self-Improving Framework with SWE-bench")
+        logger.info("🤖 Model: DeepSeek R1 on LM Studio")
+        logger.info("📊 Benchmark: SWE-bench Verified")
+        logger.info("🔄 Mode: Continuous Self-Improvement")
         
         # Setup graceful shutdown
         signal.signal(signal.SIGINT, self.shutdown_handler)
         
     def shutdown_handler(self, signum, frame):
         """Handle Ctrl+C gracefully"""
-        print("\n\n⏹️  Shutting down gracefully...")
+        logger.info("\n\n⏹️  Shutting down gracefully...")
         self.running = False
         self.export_final_results()
         sys.exit(0)
         
     def run_infinite_improvement(self):
         """Main infinite self-improvement loop"""
-        print("\n🔄 Starting Infinite Self-Improvement Loop")
-        print("Press Ctrl+C to stop and export results")
-        print("=" * 60)
+        logger.info("\n🔄 Starting Infinite Self-Improvement Loop")
+        logger.info("Press Ctrl+C to stop and export results")
+        logger.info("=" * 60)
+        
+        from agent import SimpleAgent
         
         # Create initial agent
         current_agent = SimpleAgent("./workspace")
         
         # Initial evaluation
-        print(f"\n🧪 Initial Evaluation (Iteration 0)")
-        initial_score = self.evaluator.evaluate_agent(current_agent, num_tasks=10)
+        logger.info("\n🧪 Initial Evaluation (Iteration 0)")
+        flush_logs()
+        initial_score = self.evaluator.evaluate_agent(current_agent, num_tasks=10, max_workers=self.max_workers,
+                                                     iteration=0)
         
         # Save initial agent
+        code = current_agent.get_code()
         initial_id = self.archive.save_agent(
-            code=current_agent.get_code(),
+            code=code,
+            code_hash=self.archive.hash_code(code),
             score=initial_score,
             description="Initial DeepSeek R1 agent",
             metadata={
@@ -71,35 +126,39 @@ class InfiniteSelfImprovingFramework:
         while self.running:
             try:
                 self.iteration += 1
-                print(f"\n{'='*60}")
-                print(f"🔄 ITERATION {self.iteration}")
-                print(f"🏆 Current Best Score: {self.best_score:.2%}")
-                print(f"⏰ Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                print(f"{'='*60}")
+                logger.info("\n%s", "=" * 60)
+                logger.info("🔄 ITERATION %d", self.iteration)
+                logger.info("🏆 Current Best Score: %.2f%%", self.best_score * 100)
+                logger.info("⏰ Time: %s", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                logger.info("=" * 60)
                 
                 # Generate failure analysis
                 failure_logs = self.generate_failure_analysis()
                 
                 # Self-improve
-                print("🧠 Generating self-improvement...")
+                logger.info("🧠 Generating self-improvement...")
                 improvement = current_agent.self_modify(failure_logs, self.best_score)
-                print(f"💡 Improvement idea: {improvement[:200]}...")
+                logger.info("💡 Improvement idea: %.200s...", improvement)
                 
                 # Create new agent (simplified - in practice you'd apply the improvement)
                 new_agent = SimpleAgent("./workspace")
                 new_agent.improvement_applied = improvement
                 
                 # Evaluate new agent
-                print("🧪 Evaluating improved agent...")
-                new_score = self.evaluator.evaluate_agent(new_agent, num_tasks=15)
+                logger.info("🧪 Evaluating improved agent...")
+                flush_logs()
+                new_score = self.evaluator.evaluate_agent(new_agent, num_tasks=15, max_workers=self.max_workers,
+                                                         iteration=self.iteration)
                 
                 # Determine if this is an improvement
                 is_improvement = new_score > self.best_score
                 score_change = new_score - self.best_score
                 
-                # Save to archive
+                # Save to archive; code identical to an earlier agent's is stored once
+                code = new_agent.get_code()
                 agent_id = self.archive.save_agent(
-                    code=new_agent.get_code(),
+                    code=code,
+                    code_hash=self.archive.hash_code(code),
                     score=new_score,
                     parent_id=initial_id,
                     description=f"Iteration {self.iteration} - {'Improvement' if is_improvement else 'Exploration'}",
@@ -116,10 +175,10 @@ class InfiniteSelfImprovingFramework:
                 if is_improvement:
                     self.best_score = new_score
                     current_agent = new_agent
-                    print(f"🎉 NEW BEST SCORE: {new_score:.2%} (+{score_change:.2%})")
+                    logger.info("🎉 NEW BEST SCORE: %.2f%% (+%.2f%%)", new_score * 100, score_change * 100)
                     self.log_improvement(self.iteration, new_score, "Performance improvement")
                 else:
-                    print(f"📊 Score: {new_score:.2%} ({score_change:+.2%}) - No improvement")
+                    logger.info("📊 Score: %.2f%% (%+.2f%%) - No improvement", new_score * 100, score_change * 100)
                     self.log_improvement(self.iteration, new_score, "Exploration attempt")
                 
                 # Show progress trends
@@ -129,82 +188,111 @@ class InfiniteSelfImprovingFramework:
                 if self.iteration % 5 == 0:
                     self.export_intermediate_results()
                 
-                # Brief pause
-                time.sleep(10)
+                # One batched write per iteration
+                flush_logs()
+                
+                # Pause only while recovering from a recent error
+                self._consecutive_errors = 0
+                if (self._last_error_iteration is not None
+                        and self.iteration - self._last_error_iteration <= self.pace_iterations_after_error):
+                    time.sleep(self.pace_seconds)
                 
             except Exception as e:
-                print(f"❌ Error in iteration {self.iteration}: {e}")
-                print(traceback.format_exc())
-                time.sleep(30)  # Longer pause on error
+                logger.exception("❌ Error in iteration %d: %s", self.iteration, e)
+                self._consecutive_errors += 1
+                self._last_error_iteration = self.iteration
+                delay = min(300, 2 ** self._consecutive_errors + random.random())
+                logger.info("⏳ Backing off for %.1fs", delay)
+                flush_logs()
+                time.sleep(delay)
                 continue
                 
     def generate_failure_analysis(self) -> str:
         """Generate analysis of recent failures for self-improvement"""
-        recent_results = self.evaluator.results_history[-3:] if self.evaluator.results_history else []
+        recent_results = list(islice(reversed(self.evaluator.results_history), 3))[::-1]
         
         if not recent_results:
             return "No recent evaluation data available for analysis."
         
-        failure_analysis = f"""
-Recent Performance Analysis (Last {len(recent_results)} evaluations):
-
-Performance Trend:
-"""
+        parts = [
+            "",
+            f"Recent Performance Analysis (Last {len(recent_results)} evaluations):",
+            "",
+            "Performance Trend:"
+        ]
         
         for i, result in enumerate(recent_results):
-            score = result['score']
-            failed_tasks = [r for r in result['results'] if not r['success']]
+            # Only the top 3 failures are shown; don't materialize the rest
+            failed_tasks = list(islice((r for r in result['results'] if not r['success']), 3))
             
-            failure_analysis += f"\nEvaluation {i+1}: {score:.1%} success rate\n"
-            failure_analysis += f"Failed {len(failed_tasks)} out of {result['num_tasks']} tasks\n"
+            parts.append("")
+            parts.append(f"Evaluation {i+1}: {result['score']:.1%} success rate")
+            parts.append(f"Failed {result['num_tasks'] - result['passed']} out of {result['num_tasks']} tasks")
             
             if failed_tasks:
-                failure_analysis += "Common failure patterns:\n"
-                for task in failed_tasks[:3]:  # Show top 3 failures
-                    failure_analysis += f"- {task['instance_id']}: {task['reason']}\n"
+                parts.append("Common failure patterns:")
+                parts.extend(f"- {task['instance_id']}: {task['reason']}" for task in failed_tasks)
         
         # Add improvement suggestions
-        failure_analysis += f"""
-Improvement Areas Needed:
-1. Better code understanding and analysis
-2. More sophisticated debugging techniques
-3. Improved patch generation strategies
-4. Enhanced test-driven development
-5. Better error handling and edge case coverage
-
-Current Best Score: {self.best_score:.1%}
-Target: Achieve >50% success rate on SWE-bench
-"""
+        parts.extend([
+            "",
+            "Improvement Areas Needed:",
+            "1. Better code understanding and analysis",
+            "2. More sophisticated debugging techniques",
+            "3. Improved patch generation strategies",
+            "4. Enhanced test-driven development",
+            "5. Better error handling and edge case coverage",
+            "",
+            f"Current Best Score: {self.best_score:.1%}",
+            "Target: Achieve >50% success rate on SWE-bench",
+            ""
+        ])
         
-        return failure_analysis
+        return "\n".join(parts)
     
     def log_improvement(self, iteration: int, score: float, description: str):
         """Log improvement for tracking"""
-        self.improvement_log.append({
-            "iteration": iteration,
-            "score": score,
-            "timestamp": datetime.now().isoformat(),
-            "description": description
-        })
+        timestamp = datetime.now().isoformat()
+        self.db.execute(
+            "INSERT OR REPLACE INTO improvement_log (run_id, iteration, score, ts, description) VALUES (?, ?, ?, ?, ?)",
+            (self.run_id, iteration, score, timestamp, description)
+        )
+            
+        if self._start_time is None:
+            self._start_time = timestamp
+        self._recent_scores.append(score)
+        
+    def load_improvement_log(self, limit: int = 1000) -> List[Dict]:
+        """Read back the latest improvement log entries of this run, newest first"""
+        rows = self.db.execute("""
+            SELECT iteration, score, ts, description FROM improvement_log
+            WHERE run_id = ?
+            ORDER BY iteration DESC
+            LIMIT ?
+        """, (self.run_id, limit))
+        return [
+            {"iteration": iteration, "score": score, "timestamp": ts, "description": description}
+            for iteration, score, ts, description in rows
+        ]
     
     def show_progress_summary(self):
         """Show recent progress trends"""
-        if len(self.improvement_log) < 2:
+        recent_scores = self._recent_scores
+        if len(recent_scores) < 2:
             return
             
-        recent_scores = [entry["score"] for entry in self.improvement_log[-10:]]
-        trend = "📈" if recent_scores[-1] > recent_scores else "📉" if recent_scores[-1] < recent_scores else "➡️"
+        trend = "📈" if recent_scores[-1] > recent_scores[-2] else "📉" if recent_scores[-1] < recent_scores[-2] else "➡️"
         
-        print(f"\n📊 Progress Summary:")
-        print(f"   Recent Trend: {trend}")
-        print(f"   Best Score: {max(recent_scores):.2%}")
-        print(f"   Current Score: {recent_scores[-1]:.2%}")
-        print(f"   Total Iterations: {self.iteration}")
+        logger.info("\n📊 Progress Summary:")
+        logger.info("   Recent Trend: %s", trend)
+        logger.info("   Best Score: %.2f%%", max(recent_scores) * 100)
+        logger.info("   Current Score: %.2f%%", recent_scores[-1] * 100)
+        logger.info("   Total Iterations: %d", self.iteration)
         
         # Show improvement metrics
         metrics = self.evaluator.get_improvement_metrics()
         if metrics["trend"] != "insufficient_data":
-            print(f"   Improvement Trend: {metrics['trend']} ({metrics['improvement']:+.2%})")
+            logger.info("   Improvement Trend: %s (%+.2f%%)", metrics['trend'], metrics['improvement'] * 100)
     
     def export_intermediate_results(self):
         """Export intermediate results"""
@@ -218,15 +306,16 @@ Target: Achieve >50% success rate on SWE-bench
                 "best_score": self.best_score,
                 "export_time": datetime.now().isoformat()
             },
-            "improvement_log": self.improvement_log,
-            "evaluation_history": self.evaluator.results_history,
-            "archive_stats": self.archive.get_statistics()
+            "database": self.db_path,
+            "run_id": self.run_id,
+            "evaluation_history": list(self.evaluator.results_history),
+            "archive_stats": self.archive.get_statistics(include_history=False)
         }
         
-        with open(filename, 'w') as f:
-            json.dump(results, f, indent=2)
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
         
-        print(f"💾 Progress saved to {filename}")
+        logger.info("💾 Progress saved to %s", filename)
     
     def export_final_results(self):
         """Export final comprehensive results"""
@@ -238,43 +327,64 @@ Target: Achieve >50% success rate on SWE-bench
                 "benchmark": "swe-bench-verified", 
                 "total_iterations": self.iteration,
                 "best_score_achieved": self.best_score,
-                "start_time": self.improvement_log["timestamp"] if self.improvement_log else None,
+                "start_time": self._start_time,
                 "end_time": datetime.now().isoformat(),
                 "total_runtime_hours": (time.time() - (time.time() - self.iteration * 600)) / 3600  # Rough estimate
             },
-            "improvement_trajectory": self.improvement_log,
-            "detailed_evaluations": self.evaluator.results_history,
+            "database": self.db_path,
+            "run_id": self.run_id,
+            "improvement_trajectory": self.load_improvement_log(),
+            "detailed_evaluations": self.evaluator.load_history(),
             "archive_final_state": self.archive.get_statistics(),
             "best_agents": self.archive.get_top_agents(5)
         }
         
-        with open(filename, 'w') as f:
-            json.dump(results, f, indent=2)
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
         
-        print(f"📁 Final results exported to {filename}")
-        print(f"🏆 Final best score: {self.best_score:.2%}")
-        print(f"🔄 Total iterations completed: {self.iteration}")
+        logger.info("📁 Final results exported to %s", filename)
+        logger.info("🏆 Final best score: %.2f%%", self.best_score * 100)
+        logger.info("🔄 Total iterations completed: %d", self.iteration)
 
-def main():
-    """Main function to start infinite self-improvement"""
-    print("🤖 DeepSeek R1 Self-Improving Agent Framework")
-    print("📊 SWE-bench Verified Benchmark")
-    print("🏠 Running on LM Studio (localhost:1234)")
-    print("\nMake sure LM Studio is running with deepseek-r1-0528-qwen3-8b loaded!")
-    
-    # Test LM Studio connection
+def _check_lm_studio(ready: threading.Event, status: Dict):
+    """Probe LM Studio and record the outcome in status"""
     try:
         import requests
         response = requests.get("http://localhost:1234/v1/models", timeout=5)
-        if response.status_code == 200:
-            print("✅ LM Studio connection successful")
-        else:
-            print("❌ LM Studio connection failed")
-            return
+        status["ok"] = response.status_code == 200
     except Exception as e:
-        print(f"❌ Cannot connect to LM Studio: {e}")
-        print("Please start LM Studio and load the DeepSeek R1 model")
+        status["ok"] = False
+        status["error"] = e
+    finally:
+        ready.set()
+
+def main():
+    """Main function to start infinite self-improvement"""
+    setup_logging()
+    logger.info("🤖 DeepSeek R1 Self-Improving Agent Framework")
+    logger.info("📊 SWE-bench Verified Benchmark")
+    logger.info("🏠 Running on LM Studio (localhost:1234)")
+    logger.info("\nMake sure LM Studio is running with deepseek-r1-0528-qwen3-8b loaded!")
+    flush_logs()
+    
+    # Test LM Studio connection in the background while the component modules
+    # import; the framework itself opens databases, reads SWE-bench and starts
+    # mirror clones, so it is only built once the probe has succeeded
+    lm_ready = threading.Event()
+    lm_status = {}
+    threading.Thread(target=_check_lm_studio, args=(lm_ready, lm_status), daemon=True).start()
+    
+    import agent, archive, evaluator
+    
+    lm_ready.wait()
+    if "error" in lm_status:
+        logger.error("❌ Cannot connect to LM Studio: %s", lm_status['error'])
+        logger.error("Please start LM Studio and load the DeepSeek R1 model")
+        return
+    if not lm_status["ok"]:
+        logger.error("❌ LM Studio connection failed")
         return
+    logger.info("✅ LM Studio connection successful")
     
     # Start infinite improvement
     framework = InfiniteSelfImprovingFramework()
@@ -1,21 +1,62 @@
 import requests
 import os
-from typing import List, Dict
+import time
+from collections import OrderedDict
+from typing import List, Dict, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
 
 class WebSearchService:
     def __init__(self):
         self.api_key = os.getenv('BRAVE_API_KEY')
         self.base_url = "https://api.search.brave.com/res/v1/web/search"
         
+        # Keep-alive session so repeated searches reuse the TLS connection;
+        # transient API errors and rate limits are retried with backoff
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                        raise_on_status=False)
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries))
+        
+        # ACCEPT_ENCODING includes br only when a brotli decoder is installed
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": ACCEPT_ENCODING
+        })
+        
+        # (normalized query, max_results) -> (fetched_at, results), least recently used first
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict]]]" = OrderedDict()
+        self.cache_size = 512
+        self.cache_ttl = 3600
+        
     def search(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search the web and return results"""
         if not self.api_key:
             print("Warning: No Brave API key found")
             return []
             
+        key = (query.strip().lower(), max_results)
+        now = time.monotonic()
+        hit = self._cache.get(key)
+        if hit and now - hit[0] < self.cache_ttl:
+            self._cache.move_to_end(key)
+            # Callers get their own list so edits never reach the cache
+            return list(hit[1])
+            
+        results = self._search_uncached(query, max_results)
+        
+        # Empty results also mean an API error; only cache real answers
+        if results:
+            self._cache[key] = (now, list(results))
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+        
+    def _search_uncached(self, query: str, max_results: int) -> List[Dict]:
+        """Query the Brave API"""
         headers = {
-            "Accept": "application/json",
-            "Accept-Encoding": "gzip",
             "X-Subscription-Token": self.api_key
         }
         
@@ -25,7 +66,7 @@ class WebSearchService:
         }
         
         try:
-            response = requests.get(self.base_url, headers=headers, params=params)
+            response = self.session.get(self.base_url, headers=headers, params=params, timeout=(3.05, 10))
             
             if response.status_code == 200:
                 data = response.json()
@@ -1,124 +1,394 @@
+import atexit
 import json
+import logging
 import os
+import pickle
+import queue
+import random
+import re
 import tempfile
 import subprocess
+import sys
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, fields
+from itertools import islice
 from pathlib import Path
-from datasets import load_dataset
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import shutil
 
+logger = logging.getLogger("dgm.swe_bench")
+
+# A line that starts a diff; text without one cannot apply
+_DIFF_HEADER_RE = re.compile(r'^(diff --git|--- )', re.MULTILINE)
+
+# Files a patch creates or modifies
+_PATCH_FILE_RE = re.compile(r'^\+\+\+ b/(\S+)$', re.MULTILINE)
+
+# Quiet run: no header, one line per failure, and no .pytest_cache written into the checkout
+_PYTEST_ARGS = ["-x", "-q", "--no-header", "-p", "no:cacheprovider", "--tb=line"]
+
+
+def _tail(s: str, n: int = 4096) -> str:
+    return s if len(s) <= n else s[-n:]
+
+
+@dataclass(slots=True)
+class SWEInstance:
+    """The fields of a SWE-bench row that evaluation uses"""
+    instance_id: str
+    repo: str
+    base_commit: str
+    test_patch: str
+    problem_statement: str
+    
+    @classmethod
+    def from_row(cls, row: Any) -> "SWEInstance":
+        """Build from a dataset row or a dict cached by an older version"""
+        if isinstance(row, cls):
+            return row
+        return cls(**{f.name: row.get(f.name, "") for f in fields(cls)})
+
 
 class SWEBenchLoader:
-    def __init__(self, data_dir="./swe_bench_data"):
+    def __init__(self, data_dir="./swe_bench_data", repo_cache_bytes=10 * 1024**3):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
         self.dataset = None
-        self.current_instances = []
+        self.current_instances: List[SWEInstance] = []
+        self.repos_set = set()
+        self._by_id: Dict[str, SWEInstance] = {}
+        self._rng = random.Random()
+        
+        # Worktrees persist under repos/ across runs; idle ones are evicted
+        # least recently used first once they exceed repo_cache_bytes
+        self.repo_cache_bytes = repo_cache_bytes
+        self._leased: Dict[str, str] = {}  # worktree -> repo
+        self._idle: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()  # worktree -> (repo, bytes)
+        self._sizes: Dict[str, int] = {}  # worktree -> bytes, measured once at checkout
+        self._evicting = set()  # worktrees being removed; not claimable until they are gone
+        self._state_lock = threading.Lock()
+        self._repo_locks: Dict[str, threading.Lock] = {}
+        
+        # Mirror prefetch runs on daemon threads and close() kills its git
+        # processes, so exiting never waits for a clone to finish
+        self._prefetch_stop = threading.Event()
+        self._prefetch_procs = set()
+        atexit.register(self.close)
         
     def load_swe_bench_verified(self, split="test", max_instances=50):
         """Load SWE-bench verified dataset"""
-        print("Loading SWE-bench verified dataset...")
+        cache_file = self._cache_file(split, max_instances)
+        if cache_file.exists():
+            with open(cache_file, 'rb') as f:
+                self._set_instances(pickle.load(f))
+            logger.info("Loaded %d SWE-bench instances from %s", len(self.current_instances), cache_file)
+            return True
+            
+        logger.info("Loading SWE-bench verified dataset...")
         try:
-            # Load from HuggingFace
-            self.dataset = load_dataset("princeton-nlp/SWE-bench_Verified", split=split)
+            # datasets pulls in pyarrow and pandas; only pay for it on a cache miss
+            from datasets import load_dataset
             
-            # Convert to list and limit
-            self.current_instances = list(self.dataset)[:max_instances]
-            print(f"Loaded {len(self.current_instances)} SWE-bench instances")
+            # Load only the rows we keep from HuggingFace
+            self.dataset = load_dataset("princeton-nlp/SWE-bench_Verified", split=f"{split}[:{max_instances}]",
+                                        cache_dir=str(self.data_dir))
+            self._set_instances(self.dataset)
+            logger.info("Loaded %d SWE-bench instances", len(self.current_instances))
+            
+            self._write_cache(cache_file, self.current_instances)
             
             return True
         except Exception as e:
-            print(f"Error loading SWE-bench: {e}")
+            logger.error("Error loading SWE-bench: %s", e)
             return False
     
-    def get_instance(self, instance_id: str) -> Optional[Dict]:
+    def _set_instances(self, rows: Iterable):
+        """Index the loaded instances and start fetching their repos"""
+        self.current_instances = [SWEInstance.from_row(row) for row in rows]
+        self._by_id = {inst.instance_id: inst for inst in self.current_instances}
+        self.repos_set = {inst.repo for inst in self.current_instances}
+        self.prefetch_mirrors(self.current_instances)
+        
+    def prefetch_mirrors(self, instances: Iterable[SWEInstance], max_workers: int = 4) -> List[threading.Thread]:
+        """
+        Clone or update the mirror of every repo in instances in the background
+        Failures are reported and left for setup_repository to retry
+        """
+        commits = defaultdict(list)
+        for inst in instances:
+            commits[inst.repo].append(inst.base_commit)
+            
+        pending = queue.Queue()
+        for item in commits.items():
+            pending.put(item)
+            
+        def worker():
+            while not self._prefetch_stop.is_set():
+                try:
+                    repo_name, base_commits = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with self._repo_lock(repo_name):
+                        for base_commit in base_commits:
+                            self._ensure_mirror(repo_name, base_commit, git=self._git_cancellable)
+                except subprocess.CalledProcessError as e:
+                    if not self._prefetch_stop.is_set():
+                        logger.warning("Could not prefetch %s: %s", repo_name, e.stderr)
+                        
+        threads = [threading.Thread(target=worker, name="mirror-prefetch", daemon=True)
+                   for _ in range(min(max_workers, len(commits)))]
+        for thread in threads:
+            thread.start()
+        return threads
+        
+    def close(self):
+        """Stop prefetching mirrors and kill the git processes it has running"""
+        self._prefetch_stop.set()
+        with self._state_lock:
+            procs = list(self._prefetch_procs)
+        for proc in procs:
+            proc.kill()
+        
+    def _cache_file(self, split: str, max_instances: int) -> Path:
+        return self.data_dir / f"verified_{split}_{max_instances}.pkl"
+    
+    @staticmethod
+    def _write_cache(cache_file: Path, instances: List[SWEInstance]):
+        """Write the pickle beside the target and swap it in, so a crash never leaves half a cache"""
+        tmp_file = cache_file.with_suffix(".tmp")
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(instances, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_file.replace(cache_file)
+    
+    def iter_instances(self, split="test", limit=None) -> Iterator[SWEInstance]:
+        """
+        Iterate over SWE-bench verified instances without materializing the dataset
+        The first `limit` rows are cached, so a warm start needs no network at all;
+        bounded sets are also indexed and their mirrors prefetched while the caller starts up
+        """
+        cache_file = self._cache_file(split, limit)
+        if cache_file.exists():
+            with open(cache_file, 'rb') as f:
+                self._set_instances(pickle.load(f))
+            return iter(self.current_instances)
+                
+        from datasets import load_dataset
+        dataset = load_dataset("princeton-nlp/SWE-bench_Verified", split=split, streaming=True)
+        if limit is None:
+            # Unbounded: stream lazily and leave nothing behind
+            return map(SWEInstance.from_row, dataset)
+            
+        # Bounded: stream just these rows once and cache them for the next start
+        self._set_instances(islice(dataset, limit))
+        self._write_cache(cache_file, self.current_instances)
+        return iter(self.current_instances)
+    
+    def get_instance(self, instance_id: str) -> Optional[SWEInstance]:
         """Get a specific instance by ID"""
-        for instance in self.current_instances:
-            if instance['instance_id'] == instance_id:
-                return instance
-        return None
+        return self._by_id.get(instance_id)
     
-    def get_random_instance(self) -> Dict:
+    def get_random_instance(self) -> SWEInstance:
         """Get a random instance for testing"""
-        import random
-        return random.choice(self.current_instances)
+        return self._rng.choice(self.current_instances)
     
-    def setup_repository(self, instance: Dict) -> str:
-        """Setup repository for an instance"""
-        instance_id = instance['instance_id']
-        repo_name = instance['repo']
-        base_commit = instance['base_commit']
+    def setup_repository(self, instance: SWEInstance) -> str:
+        """Lease a clean worktree of the instance's repo at its base commit"""
+        repo_name = instance.repo
+        base_commit = instance.base_commit
+        repo_dir = None
         
-        # Create temp directory for this instance
-        repo_dir = self.data_dir / f"repos/{instance_id}"
-        repo_dir.parent.mkdir(exist_ok=True)
+        try:
+            with self._repo_lock(repo_name):
+                mirror = self._ensure_mirror(repo_name, base_commit)
+                repo_dir = self._claim_worktree(repo_name, base_commit)
+                
+                if Path(repo_dir).exists():
+                    # Already at base_commit; only local edits need discarding
+                    try:
+                        self._git("-C", repo_dir, "reset", "--hard", base_commit)
+                        self._git("-C", repo_dir, "clean", "-fdx")
+                        self._record_size(repo_dir)
+                        return repo_dir
+                    except subprocess.CalledProcessError:
+                        self._remove_worktree(mirror, repo_dir)
+                        with self._state_lock:
+                            self._sizes.pop(repo_dir, None)
+                
+                logger.info("Setting up repository for %s...", instance.instance_id)
+                Path(repo_dir).parent.mkdir(parents=True, exist_ok=True)
+                self._git("-C", str(mirror), "worktree", "add", "--detach", repo_dir, base_commit)
+                self._record_size(repo_dir)
+                return repo_dir
+                
+        except subprocess.CalledProcessError as e:
+            if repo_dir is not None:
+                with self._state_lock:
+                    self._leased.pop(repo_dir, None)
+            raise Exception(f"Failed to set up repository: {e.stderr}")
+    
+    def release_repository(self, repo_dir: str):
+        """Return a leased worktree to the cache and evict past the byte budget"""
+        evicted = []
         
-        if repo_dir.exists():
-            shutil.rmtree(repo_dir)
+        with self._state_lock:
+            repo_name = self._leased.pop(repo_dir, None)
+            if repo_name is None:
+                return
+            self._idle[repo_dir] = (repo_name, self._sizes.get(repo_dir, 0))
+            
+            total = sum(size for _, size in self._idle.values())
+            while total > self.repo_cache_bytes and self._idle:
+                path, (name, size) = self._idle.popitem(last=False)
+                total -= size
+                evicted.append((name, path))
+                self._evicting.add(path)
+                self._sizes.pop(path, None)
         
-        print(f"Setting up repository for {instance_id}...")
+        for name, path in evicted:
+            try:
+                with self._repo_lock(name):
+                    self._remove_worktree(self._mirror_path(name), path)
+            finally:
+                with self._state_lock:
+                    self._evicting.discard(path)
+    
+    def _record_size(self, repo_dir: str):
+        """Measure a checkout the first time it is leased; reuse resets it to the same tree"""
+        with self._state_lock:
+            if repo_dir in self._sizes:
+                return
+        size = self._dir_size(repo_dir)
+        with self._state_lock:
+            self._sizes[repo_dir] = size
+    
+    def _repo_lock(self, repo_name: str) -> threading.Lock:
+        """Per-repo lock guarding its mirror and worktree metadata"""
+        with self._state_lock:
+            return self._repo_locks.setdefault(repo_name, threading.Lock())
+    
+    def _mirror_path(self, repo_name: str) -> Path:
+        return self.data_dir / "mirrors" / f"{repo_name.replace('/', '__')}.git"
+    
+    def _ensure_mirror(self, repo_name: str, base_commit: str, git=None) -> Path:
+        """Blobless bare mirror of the repo that contains base_commit"""
+        git = git or self._git
+        mirror = self._mirror_path(repo_name)
         
-        # Clone repository
-        clone_cmd = f"git clone https://github.com/{repo_name}.git {repo_dir}"
-        result = subprocess.run(clone_cmd, shell=True, capture_output=True, text=True)
+        if not mirror.exists():
+            # Clone beside the mirror and rename, so a killed clone leaves no half mirror
+            partial = mirror.with_name(mirror.name + ".partial")
+            shutil.rmtree(partial, ignore_errors=True)
+            mirror.parent.mkdir(parents=True, exist_ok=True)
+            git("clone", "--bare", "--filter=blob:none", f"https://github.com/{repo_name}.git", str(partial))
+            partial.rename(mirror)
         
-        if result.returncode != 0:
-            raise Exception(f"Failed to clone repository: {result.stderr}")
+        has_commit = subprocess.run(["git", "-C", str(mirror), "cat-file", "-e", f"{base_commit}^{{commit}}"],
+                                    capture_output=True)
+        if has_commit.returncode != 0:
+            git("-C", str(mirror), "fetch", "origin", base_commit)
         
-        # Checkout base commit
-        checkout_cmd = f"cd {repo_dir} && git checkout {base_commit}"
-        result = subprocess.run(checkout_cmd, shell=True, capture_output=True, text=True)
+        return mirror
+    
+    def _claim_worktree(self, repo_name: str, base_commit: str) -> str:
+        """Pick the first worktree path for base_commit that no other task holds"""
+        # Absolute, since git resolves worktree paths relative to the mirror
+        base = self.data_dir.resolve() / "repos" / repo_name.replace('/', '__') / base_commit
         
+        with self._state_lock:
+            n = 0
+            while True:
+                repo_dir = str(base if n == 0 else base.with_name(f"{base_commit}-{n}"))
+                if repo_dir not in self._leased and repo_dir not in self._evicting:
+                    self._idle.pop(repo_dir, None)
+                    self._leased[repo_dir] = repo_name
+                    return repo_dir
+                n += 1
+    
+    def _remove_worktree(self, mirror: Path, repo_dir: str):
+        result = subprocess.run(["git", "-C", str(mirror), "worktree", "remove", "--force", repo_dir],
+                                capture_output=True)
         if result.returncode != 0:
-            print(f"Warning: Could not checkout base commit: {result.stderr}")
+            shutil.rmtree(repo_dir, ignore_errors=True)
+            subprocess.run(["git", "-C", str(mirror), "worktree", "prune"], capture_output=True)
+    
+    @staticmethod
+    def _git(*args: str) -> subprocess.CompletedProcess:
+        return subprocess.run(["git", *args], check=True, capture_output=True, text=True)
         
-        return str(repo_dir)
+    def _git_cancellable(self, *args: str) -> subprocess.CompletedProcess:
+        """_git for prefetch work; close() kills the process"""
+        with self._state_lock:
+            if self._prefetch_stop.is_set():
+                raise subprocess.CalledProcessError(-1, ["git", *args], stderr="prefetch stopped")
+            proc = subprocess.Popen(["git", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            self._prefetch_procs.add(proc)
+        try:
+            stdout, stderr = proc.communicate()
+        finally:
+            with self._state_lock:
+                self._prefetch_procs.discard(proc)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args, stdout, stderr)
+        return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
     
-    def run_tests(self, repo_dir: str, instance: Dict) -> Dict:
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+    
+    def run_tests(self, repo_dir: str, instance: SWEInstance) -> Dict:
         """Run tests for an instance"""
-        test_patch = instance.get('test_patch', '')
+        test_patch = instance.test_patch
         
         if not test_patch:
             return {"passed": False, "reason": "No test patch available"}
         
         try:
-            # Apply test patch
-            test_file = Path(repo_dir) / "test_patch.patch"
-            test_file.write_text(test_patch)
-            
-            apply_cmd = f"cd {repo_dir} && git apply test_patch.patch"
-            result = subprocess.run(apply_cmd, shell=True, capture_output=True, text=True)
+            # Apply test patch from stdin so nothing is written into the checkout
+            result = subprocess.run(["git", "apply", "-"], input=test_patch, cwd=repo_dir,
+                                    capture_output=True, text=True, check=False)
             
             if result.returncode != 0:
                 return {"passed": False, "reason": f"Failed to apply test patch: {result.stderr}"}
             
-            # Run tests (this varies by repository, simplified here)
-            test_cmd = f"cd {repo_dir} && python -m pytest -xvs"
-            result = subprocess.run(test_cmd, shell=True, capture_output=True, text=True, timeout=300)
+            # Run only the test files the test patch touches (this varies by repository, simplified here)
+            test_files = [f for f in _PATCH_FILE_RE.findall(test_patch)
+                          if f.endswith(".py") and (Path(repo_dir) / f).exists()]
+            result = subprocess.run([sys.executable, "-m", "pytest", *_PYTEST_ARGS, *test_files], cwd=repo_dir,
+                                    capture_output=True, text=True, timeout=300, check=False)
             
+            # The summary and failures are at the end; keep only the tail
             return {
                 "passed": result.returncode == 0,
-                "stdout": result.stdout,
-                "stderr": result.stderr,
+                "stdout": _tail(result.stdout),
+                "stderr": _tail(result.stderr),
                 "returncode": result.returncode
             }
             
         except Exception as e:
             return {"passed": False, "reason": str(e)}
     
-    def evaluate_patch(self, repo_dir: str, patch_content: str, instance: Dict) -> Dict:
+    def evaluate_patch(self, repo_dir: str, patch_content: str, instance: SWEInstance) -> Dict:
         """Evaluate if a patch solves the issue"""
+        if not _DIFF_HEADER_RE.search(patch_content):
+            return {"success": False, "reason": "No diff header", "score": 0.0}
+            
         try:
             # Reset repository
-            reset_cmd = f"cd {repo_dir} && git checkout HEAD -- ."
-            subprocess.run(reset_cmd, shell=True)
-            
-            # Apply the agent's patch
-            patch_file = Path(repo_dir) / "agent_patch.patch"
-            patch_file.write_text(patch_content)
+            subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=repo_dir, capture_output=True, check=False)
             
-            apply_cmd = f"cd {repo_dir} && git apply agent_patch.patch"
-            result = subprocess.run(apply_cmd, shell=True, capture_output=True, text=True)
+            # Apply the agent's patch; git apply is all-or-nothing, so a patch
+            # that cannot apply fails here and the test run is skipped
+            result = subprocess.run(["git", "apply", "-"], input=patch_content, cwd=repo_dir,
+                                    capture_output=True, text=True, check=False)
             
             if result.returncode != 0:
                 return {
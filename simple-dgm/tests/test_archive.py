@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from archive import SimpleArchive
+
+
+class CodeStorageMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self._tmp.name, "agents.db")
+
+        # Archive as written before code moved out of the agents table
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE agents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT NOT NULL,
+                score REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                parent_id INTEGER,
+                description TEXT,
+                metadata TEXT,
+                is_functional BOOLEAN DEFAULT 1
+            )
+        """)
+        conn.execute("CREATE INDEX idx_agent_score ON agents(score)")
+        conn.executemany("INSERT INTO agents (code, score, description, metadata) VALUES (?, ?, ?, '{}')", [
+            ("print('a')\n", 0.1, "first"),
+            ("print('a')\n", 0.2, "same code"),
+            ("print('b')\n", 0.3, "other code"),
+        ])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _agent_code_rows(self, archive: SimpleArchive) -> int:
+        with archive._acquire() as conn:
+            return conn.execute("SELECT COUNT(*) FROM agent_code").fetchone()[0]
+
+    def test_inline_code_moves_to_hashed_storage(self):
+        archive = SimpleArchive(self.db_path)
+        try:
+            self.assertEqual([archive.get_agent(i)["code"] for i in (1, 2, 3)],
+                             ["print('a')\n", "print('a')\n", "print('b')\n"])
+            self.assertEqual(archive.get_agent(1)["code_hash"], archive.hash_code("print('a')\n"))
+            # Identical code is stored once
+            self.assertEqual(self._agent_code_rows(archive), 2)
+            with archive._acquire() as conn:
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(agents)")]
+            self.assertNotIn("code", columns)
+        finally:
+            archive.close()
+
+    def test_migrated_archive_reopens_and_dedupes_new_agents(self):
+        SimpleArchive(self.db_path).close()
+
+        archive = SimpleArchive(self.db_path)
+        try:
+            agent_id = archive.save_agent(code="print('b')\n", score=0.4)
+            self.assertEqual(archive.get_agent(agent_id)["code"], "print('b')\n")
+            self.assertEqual(self._agent_code_rows(archive), 2)
+        finally:
+            archive.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from evaluator import SWEBenchEvaluator
+from swe_bench_loader import SWEInstance, swe_bench
+
+
+def _git(repo: str, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", "-C", repo, *args], capture_output=True, text=True, check=True)
+
+
+class ExtractPatchTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.repo = self._tmp.name
+        _git(self.repo, "init", "-q")
+        Path(self.repo, "calc.py").write_text("def add(a, b):\n    return a - b\n")
+        _git(self.repo, "add", ".")
+        _git(self.repo, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "init")
+
+        # extract_patch_from_solution reads no evaluator state
+        self.evaluator = SWEBenchEvaluator.__new__(SWEBenchEvaluator)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_fenced_patch_applies(self):
+        solution = (
+            "The subtraction should be an addition.\n\n"
+            "```diff\n"
+            "diff --git a/calc.py b/calc.py\n"
+            "--- a/calc.py\n"
+            "+++ b/calc.py\n"
+            "@@ -1,2 +1,2 @@\n"
+            " def add(a, b):\n"
+            "-    return a - b\n"
+            "+    return a + b\n"
+            "```\n"
+        )
+        patch = self.evaluator.extract_patch_from_solution(solution, self.repo)
+
+        self.assertTrue(patch.endswith("+    return a + b\n"))
+        result = subprocess.run(["git", "apply", "-"], input=patch, cwd=self.repo,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("return a + b", Path(self.repo, "calc.py").read_text())
+
+
+class TaskTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        with mock.patch.object(swe_bench, "iter_instances"):
+            self.evaluator = SWEBenchEvaluator(db_path=os.path.join(self._tmp.name, "eval.db"))
+
+    def tearDown(self):
+        self.evaluator.db.close()
+        self._tmp.cleanup()
+
+    def _evaluate(self, durations, workers, timeout):
+        """Run tasks that sleep for the given durations; return the score and wall time"""
+        instances = [SWEInstance(f"o__r-{i}", "o/r", "c", "", "") for i in range(len(durations))]
+
+        def sleep_task(instance, agent):
+            duration = durations[instances.index(instance)]
+            time.sleep(duration)
+            return {"instance_id": instance.instance_id, "success": True, "score": 1.0,
+                    "reason": "ok", "elapsed_time": duration}
+
+        self.evaluator._evaluate_one = sleep_task
+        start = time.monotonic()
+        with mock.patch.object(swe_bench, "current_instances", instances):
+            score = self.evaluator.evaluate_agent(None, num_tasks=len(durations), timeout=timeout,
+                                                  max_workers=workers)
+        return score, time.monotonic() - start
+
+    def test_queued_task_gets_its_own_budget(self):
+        # The last task finishes after 0.65s overall but within 0.5s of starting
+        score, _ = self._evaluate([1.5, 0.05, 0.3, 0.3], workers=2, timeout=0.5)
+
+        self.assertEqual(score, 0.75)
+        reasons = [row[0] for row in self.evaluator.db.execute(
+            "SELECT reason FROM evaluation_history ORDER BY rowid")]
+        self.assertEqual(reasons, ["Timed out after 0.5s", "ok", "ok", "ok"])
+
+    def test_task_that_never_starts_is_abandoned(self):
+        # Both workers stay busy, so the third task is dropped at the overall deadline
+        score, elapsed = self._evaluate([2.0, 2.0, 0.05], workers=2, timeout=0.3)
+
+        self.assertEqual(score, 0.0)
+        self.assertLess(elapsed, 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
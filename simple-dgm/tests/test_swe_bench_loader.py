@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from swe_bench_loader import SWEBenchLoader, SWEInstance
+
+
+def _git(repo: str, *args: str) -> str:
+    return subprocess.run(["git", "-C", repo, *args], capture_output=True, text=True, check=True).stdout.strip()
+
+
+class WorktreeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        upstream = os.path.join(self._tmp.name, "upstream")
+        os.makedirs(upstream)
+        _git(upstream, "init", "-q")
+        self.commits = []
+        for i in range(2):
+            Path(upstream, f"f{i}.py").write_text("x = 1\n" * 200)
+            _git(upstream, "add", ".")
+            _git(upstream, "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", f"c{i}")
+            self.commits.append(_git(upstream, "rev-parse", "HEAD"))
+
+        self.loader = SWEBenchLoader(data_dir=os.path.join(self._tmp.name, "data"))
+        # A local mirror stands in for the GitHub clone
+        mirror = self.loader._mirror_path("o/r")
+        mirror.parent.mkdir(parents=True)
+        subprocess.run(["git", "clone", "-q", "--bare", upstream, str(mirror)], check=True)
+
+    def tearDown(self):
+        self.loader.close()
+        self._tmp.cleanup()
+
+    def _instance(self, n: int) -> SWEInstance:
+        return SWEInstance.from_row({"instance_id": f"i{n}", "repo": "o/r", "base_commit": self.commits[n]})
+
+    def test_concurrent_leases_get_separate_worktrees(self):
+        first = self.loader.setup_repository(self._instance(0))
+        second = self.loader.setup_repository(self._instance(0))
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(sorted(os.listdir(first)), [".git", "f0.py"])
+
+    def test_released_worktree_is_reused_clean(self):
+        repo_dir = self.loader.setup_repository(self._instance(0))
+        Path(repo_dir, "f0.py").write_text("edited\n")
+        Path(repo_dir, "junk.txt").write_text("junk\n")
+        self.loader.release_repository(repo_dir)
+
+        self.assertEqual(self.loader.setup_repository(self._instance(0)), repo_dir)
+        self.assertEqual(sorted(os.listdir(repo_dir)), [".git", "f0.py"])
+        self.assertEqual(Path(repo_dir, "f0.py").read_text(), "x = 1\n" * 200)
+
+    def test_release_evicts_least_recently_used_past_budget(self):
+        old = self.loader.setup_repository(self._instance(0))
+        new = self.loader.setup_repository(self._instance(1))
+        # Room for the newer checkout alone
+        self.loader.repo_cache_bytes = self.loader._sizes[new]
+
+        self.loader.release_repository(old)
+        self.loader.release_repository(new)
+
+        self.assertEqual(list(self.loader._idle), [new])
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+
+    def test_evicting_worktree_is_not_claimable_until_removed(self):
+        repo_dir = self.loader.setup_repository(self._instance(0))
+        self.loader.repo_cache_bytes = 0
+
+        removing = threading.Event()
+        proceed = threading.Event()
+        remove = self.loader._remove_worktree
+
+        def blocked_remove(mirror, path):
+            removing.set()
+            proceed.wait(5)
+            remove(mirror, path)
+
+        self.loader._remove_worktree = blocked_remove
+        release = threading.Thread(target=self.loader.release_repository, args=(repo_dir,))
+        release.start()
+        self.assertTrue(removing.wait(5))
+
+        # Mid-removal the path is skipped, not handed out half deleted
+        other = self.loader._claim_worktree("o/r", self.commits[0])
+        self.assertNotEqual(other, repo_dir)
+
+        proceed.set()
+        release.join(5)
+        self.assertEqual(self.loader._claim_worktree("o/r", self.commits[0]), repo_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
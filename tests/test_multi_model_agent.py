@@ -0,0 +1,87 @@
+import asyncio
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent.multi_model_agent import ModelProvider, MultiModelAgent
+from config.settings import Settings
+
+GROQ = ModelProvider.GROQ
+OPENROUTER = ModelProvider.OPENROUTER
+MESSAGES = [{"role": "user", "content": "fix the bug"}]
+
+
+@unittest.skipUnless(importlib.util.find_spec("openai"), "openai is not installed")
+class FailoverTest(unittest.TestCase):
+    def setUp(self):
+        from openai import APIError
+
+        class Outage(APIError):
+            def __init__(self):
+                Exception.__init__(self, "outage")
+
+        self._tmp = tempfile.TemporaryDirectory()
+        self.agent = MultiModelAgent(settings=Settings(ARCHIVE_DIR=Path(self._tmp.name)))
+        self.agent.clients = {GROQ: object(), OPENROUTER: object()}
+        self.agent.current_provider = GROQ
+        self.down = {GROQ}
+        self.sent = []
+
+        async def send(provider, messages, on_delta):
+            self.sent.append(provider)
+            await asyncio.sleep(0.05)
+            if provider in self.down:
+                raise Outage()
+            return {"content": "ok", "finish_reason": "stop", "provider": provider.value}
+
+        self.agent._send_request = send
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_fails_over_to_next_provider(self):
+        result = asyncio.run(self.agent.call_model(MESSAGES))
+
+        self.assertEqual(result["provider"], OPENROUTER.value)
+        self.assertEqual(self.sent, [GROQ, OPENROUTER])
+        self.assertEqual(self.agent.breaker[GROQ]["fails"], 1)
+
+    def test_open_circuit_is_skipped(self):
+        for _ in range(self.agent.breaker_threshold):
+            asyncio.run(self.agent.call_model(MESSAGES))
+        self.sent.clear()
+
+        asyncio.run(self.agent.call_model(MESSAGES))
+
+        self.assertEqual(self.sent, [OPENROUTER])
+
+    def test_success_closes_circuit(self):
+        asyncio.run(self.agent.call_model(MESSAGES))
+        self.down.clear()
+
+        asyncio.run(self.agent.call_model(MESSAGES))
+
+        self.assertEqual(self.agent.breaker[GROQ], {"fails": 0, "open_until": 0})
+
+    def test_coalesced_failure_counts_once(self):
+        self.down = {GROQ, OPENROUTER}
+
+        async def burst():
+            calls = [self.agent.call_model(MESSAGES) for _ in range(self.agent.breaker_threshold)]
+            return await asyncio.gather(*calls, return_exceptions=True)
+
+        results = asyncio.run(burst())
+
+        # One API call per provider served every caller, so neither circuit opens
+        self.assertTrue(all(isinstance(r, Exception) for r in results))
+        self.assertEqual(self.sent, [GROQ, OPENROUTER])
+        self.assertEqual(self.agent.breaker[GROQ]["fails"], 1)
+        self.assertEqual(self.agent.breaker[OPENROUTER]["open_until"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()